@@ -86,6 +86,12 @@
 
 import os
 import sys
+import time
+import argparse
+import hashlib
+import shelve
+from collections import OrderedDict, deque
+from fractions import Fraction
 import unittest
 import logging
 import logging.config
@@ -109,19 +115,84 @@ logging.config.dictConfig({'version': 1,
                            })
 logger = logging.getLogger(__name__)
 
+# Set this to True (and console handler level to DEBUG) to trace every
+# reduction step. Trace calls in hot loops are guarded by this flag, so
+# when it is off no message or log record is built at all.
+TRACE = False
 
-def qsort(list):
+
+class FloatDelays(object):
     """
-    Quick sort using list comprehensions
-    average complexity: O(n*logn)
+    Delays arithmetic on floats
+
+    Fastest one, but rounding error accumulates over thousands of
+    parallel reductions. Integer delays of input are kept as is,
+    first parallel reduction makes a float of them.
     """
-    if list == []:
-        return []
-    else:
-        pivot = list[0]
-        lesser = qsort([x for x in list[1:] if x < pivot])
-        greater = qsort([x for x in list[1:] if x >= pivot])
-        return lesser + [pivot] + greater
+
+    name = "float"
+    scale = 1  # input delays are kept unscaled
+
+    def delay(self, value):
+        """ Convert input delay (int) to delay used in reductions """
+        return value
+
+    def parallel(self, d1, d2):
+        """ Delay of two parallel non zero delays """
+        return (d1 * d2) / (d1 + d2)
+
+    def format(self, d):
+        """ Delay as string for output """
+        if d == int(d):
+            return "%d" % d
+        return repr(float(d))
+
+
+class FractionDelays(FloatDelays):
+    """ Exact delays arithmetic with fractions.Fraction, slowest one """
+
+    name = "fraction"
+
+    def delay(self, value):
+        return Fraction(value)
+
+    def format(self, d):
+        return str(Fraction(d))  # e.g. "2" or "8/3"
+
+
+class FixedPointDelays(FloatDelays):
+    """
+    Delays arithmetic on integers scaled by 10^digits
+
+    Nearly as fast as floats, parallel reduction is rounded to the nearest
+    1/10^digits, so error stays within 1/10^digits per reduction and does
+    not depend on magnitude of delays.
+    """
+
+    name = "fixed"
+
+    def __init__(self, digits=6):
+        self.digits = digits
+        self.scale = 10 ** digits
+
+    def delay(self, value):
+        return int(round(value * self.scale))
+
+    def parallel(self, d1, d2):
+        s = d1 + d2
+        return (d1 * d2 + s // 2) // s
+
+    def format(self, d):
+        whole, part = divmod(d, self.scale)
+        if part == 0:
+            return "%d" % whole
+        return ("%d.%0*d" % (whole, self.digits, part)).rstrip("0")
+
+
+# numeric backends by name, float is default one
+DELAYS = {"float": FloatDelays(),
+          "fraction": FractionDelays(),
+          "fixed": FixedPointDelays()}
 
 
 def redirect_edge_alpabetically(edge):
@@ -133,12 +204,11 @@ def redirect_edge_alpabetically(edge):
         - edge: list, could be changed
     """
     if edge[0].lower() > edge[1].lower():
-        msg = "{} ".format(edge)
         work = edge[0]
         edge[0] = edge[1]
         edge[1] = work
-        msg += "-> {}".format(edge)
-        logger.debug(msg)
+        if TRACE:
+            logger.debug("%s -> %s", [work, edge[0]] + edge[2:], edge)
 
 
 def get_transition_vertexes(dd, start, end):
@@ -182,7 +252,8 @@ def arrange_merge_pair(dd, c, start, end):
     Returns:
         - list of 2 nodes, where 1st will be kept, 2nd - merged
     """
-    logger.debug("arrange merge pair: {}".format(c))
+    if TRACE:
+        logger.debug("arrange merge pair: %s", c)
     if c[0] == start or c[0] == end:
         if c[1] == start or c[1] == end:
             return None  # this is start-end edge, shouldn't be merged
@@ -219,40 +290,53 @@ def merge(to, _from, dd, edges):
         # for each edge substitute vertex with @to
         e = edges[i]
         e[e.index(_from)] = to
+        redirect_edge_alpabetically(e)
 
     # at this point one closed edge is going to appear
 
+    # connections of @from belong to @to from now on,
+    # so following merges of @to will move them as well
+    dd[to][0] += dd[_from][0]
+    dd[to].extend(dd[_from][1:])
+
 
-def reduce_parallel(edges):
+def reduce_parallel(edges, delays=DELAYS["float"]):
     """ Find and reduces parallel edges in the list
 
-    Sorts list.
+    Sorts list in place (list.sort, no recursion, so long and mostly
+    sorted lists are fine).
 
     Arguments:
         - edges: list of edges, e.g. [['a', 'b', 5], ['a', 'c', 5], ... ]
+        - delays: numeric backend, e.g. DELAYS["fraction"]
     """
-    edges[:] = qsort(edges)
+    parallel = delays.parallel
+    edges.sort()
     logger.debug("Performing parallel optimization\n")
     e = edges  # use shorter name for edges
+    if not e:
+        return 0  # nothing to reduce (and nothing to keep)
 
     l = 0  # l stands for left and points to left side of comparison
     # r stands for right and points to the right side of comparison
     # items are sorted in the list, so parallel
     # edges are going to be next to each other
     for r in range(1, len(e)):
-        logger.debug("CMP e[{}]:{} to e[{}]:{}".format(l, e[l], r, e[r]))
+        if TRACE:
+            logger.debug("CMP e[%s]:%s to e[%s]:%s", l, e[l], r, e[r])
         if (e[l][0] == e[r][0] and e[l][1] == e[r][1]):
             # for parallel edges - overwrite left delay with balanced delay
             # except if one of the edges is zero = set zero
             if(e[r][2] == 0):
                 e[l][2] = 0
             else:
-                e[l][2] = (e[l][2] * e[r][2]) / (e[l][2] + e[r][2])
+                e[l][2] = parallel(e[l][2], e[r][2])
 
             # keep right edge value unchanged as
             # it is going to be overwritten later,
             # when not parallel edges is going to be found
-            logger.debug(" Parallel: new value e[{}]:{}".format(l, e[l]))
+            if TRACE:
+                logger.debug(" Parallel: new value e[%s]:%s", l, e[l])
         else:
             # for not equal edges
             # copy right component to the place right after left.
@@ -261,17 +345,19 @@ def reduce_parallel(edges):
             # that were merged with their lefts
             l += 1
             e[l] = e[r]
-            logger.debug("     NOT Parallel: e[{}]:{} <= e[{}]:{}".format(
-                l, e[l], r, e[r]))
+            if TRACE:
+                logger.debug("     NOT Parallel: e[%s]:%s <= e[%s]:%s",
+                             l, e[l], r, e[r])
 
     # by the time this loop is ended l is going to point
     # to last meaningful edge in the list
     kept = l + 1
     removed = len(e) - kept
-    logger.debug("\n{} parallels removed\n".format(removed))
+    logger.debug("\n%s parallels removed\n", removed)
 
     e[:] = e[:kept]
-    logger.debug("Parallel reduce result edges: {}\n".format(e))
+    if TRACE:
+        logger.debug("Parallel reduce result edges: %s\n", e)
 
     return removed
 
@@ -287,6 +373,8 @@ def eliminate_zero_edges(edges, start, end):
         - start: start vertex, e.g. 'a'
         - end: end vertex, e.g. 'b'
 
+    Returns:
+        - amount of zero edges removed
     """
     # Gathers indexes of zeroed edges and merges vertexes connected by edges
     # with 0 delay
@@ -310,20 +398,26 @@ def eliminate_zero_edges(edges, start, end):
             #edge was processed already
             continue
 
-        keep, eliminate = arrange_merge_pair(dd, candidates, start, end)
-        if eliminate is None:
+        pair = arrange_merge_pair(dd, candidates, start, end)
+        if pair is None:
             continue  # this is start-end edge, keep it
+        keep, eliminate = pair
+
         merge(keep, eliminate, dd, edges)
 
         # at this point one closed edge is going to appear
         # k-m edge with zero delay after substitution will become m-m edge.
         # we will remove it later
 
-    for i in reversed(sorted(zero_edges_indices)):
-        logger.debug("removing zero edge: {}: {}".format(i, edges[i]))
-        edges.pop(i)
+    # all merged zero edges are cycled now (start-end one is kept),
+    # as well as other edges between merged vertexes, e.g. k-m edge
+    # parallel to k-x-m zero path. Cycles do not affect delay.
+    removed = remove_cycled_edges(edges)
 
-    logger.debug("\neliminate zero result edges:  {}\n".format(edges))
+    if TRACE:
+        logger.debug("\neliminate zero result edges:  %s\n", edges)
+
+    return removed
 
 
 def reduce_sequential(edges, start, end):
@@ -354,8 +448,9 @@ def reduce_sequential(edges, start, end):
     """
     dd = get_degrees_dictionary(edges)  # O(len(edges))
     tvs = get_transition_vertexes(dd, start, end)  # O(len(dd))
-    logger.debug("dd: {}".format(dd))
-    logger.debug("tvs: {}".format(tvs))
+    if TRACE:
+        logger.debug("dd: %s", dd)
+        logger.debug("tvs: %s", tvs)
 
     for v in tvs:  # for each vertex in transitional vertexes
         # edges
@@ -372,8 +467,9 @@ def reduce_sequential(edges, start, end):
         #      will be moved to e1 substituting v there
         #      edges list in transitional vertex dictionary will be updated
 
-        logger.debug("Substituted {}: {}:{}, {}:{} -> ".format(
-            v, ei1, e1, ei2, e2))
+        if TRACE:
+            logger.debug("Substituted %s: %s:%s, %s:%s -> ",
+                         v, ei1, e1, ei2, e2)
 
         # v is going to be substituted in e1 by value of "not v" vertex in e2
         substitute_index_in_ei2 = 1 - e2.index(v)  # if vi=0 s=1; v=1 s=0
@@ -392,16 +488,14 @@ def reduce_sequential(edges, start, end):
         # ei1 edge instead of ei2
         # e.g. 'v2' was connected by ei2, now is connected by ei1
 
-        if v2 != start and v2 != end:
-            # v2 is not present in tvi and shouldn't be updated
+        if v2 in tvs:
+            # v2 is transitional as well, its edge ei2 became ei1
+            # (start, end and junctions are not in tvs and aren't updated)
             v2ei = tvs[v2]  # list of edges indexes for v2
-            vei = tvs[v]    # list of edges indexes for v
             v2ei[v2ei.index(ei2)] = ei1
 
-            logger.debug("tvs[{}][2] = t[1] : {} = {}".format(
-                v2,
-                tvs[v2][2],
-                t[1]))
+            if TRACE:
+                logger.debug("tvs[%s] = %s", v2, tvs[v2])
 
         # update weight
         new_weight = e1[2] + e2[2]
@@ -417,17 +511,147 @@ def reduce_sequential(edges, start, end):
         # only thing left is to remove the ei2 edge, this will be done later
         # not to break iteration over edges
 
-        logger.debug("{}:{}, {}:{}".format(ei1, e1, ei2, e2))
+        if TRACE:
+            logger.debug("%s:%s, %s:%s", ei1, e1, ei2, e2)
+
+    # remove ei2 edges, they all are cycled now. Resulting ei1 edge
+    # could become cycled too, if v1 and v2 were the same vertex
+    return remove_cycled_edges(edges)  # amount of edges removed
+
+
+def remove_cycled_edges(edges):
+    """
+    Remove edges connecting vertex to itself, e.g. ['m', 'm', 5]
+
+    Arguments:
+        - edges: list of edges, changed in place
+
+    Returns:
+        - amount of edges removed
+    """
+    kept = [e for e in edges if e[0] != e[1]]
+    removed = len(edges) - len(kept)
+    if TRACE:
+        logger.debug("Cycled edges removed: %s",
+                     [e for e in edges if e[0] == e[1]])
+    edges[:] = kept
+    return removed
+
+
+def lowpoint_dfs(adjacency, other, root):
+    """
+    Iterative DFS from @root computing low points (Hopcroft-Tarjan)
 
-    # get indexes of edges to be removed
-    indexes = [i for i in reversed(sorted([tvs[v][1] for v in tvs]))]
-    logger.debug("Edges index removed after sequential update: {}".format(
-        indexes))
+    Low point of a vertex is the smallest discovery number reachable from
+    its DFS subtree by at most one back edge. Tree edge p-v starts a new
+    biconnected component when low[v] >= disc[p], so p separates subtree
+    of v from the rest of the graph.
 
-    for i in indexes:
-        edges.pop(i)
+    Arguments:
+        - adjacency: vertex -> list of ids of its edges
+        - other: function(edge id, vertex) returning other end of the edge
+        - root: vertex to start from
 
-    return len(tvs)  # amount of edges removed
+    Returns:
+        - (disc, low, parent, order): discovery numbers and low points of
+            reached vertexes, parent maps vertex to (parent vertex, tree
+            edge id), order lists vertexes in discovery order
+    """
+    disc = {root: 0}
+    low = {root: 0}
+    parent = {root: (None, None)}
+    order = [root]
+    stack = [(root, iter(adjacency[root]))]
+    while stack:
+        v, neighbours = stack[-1]
+        advanced = False
+        for i in neighbours:
+            if i == parent[v][1]:
+                continue
+            u = other(i, v)
+            if u in disc:
+                low[v] = min(low[v], disc[u])
+            else:
+                disc[u] = low[u] = len(order)
+                parent[u] = (v, i)
+                order.append(u)
+                stack.append((u, iter(adjacency[u])))
+                advanced = True
+                break
+        if not advanced:
+            stack.pop()
+            p = parent[v][0]
+            if p is not None:
+                low[p] = min(low[p], low[v])
+    return disc, low, parent, order
+
+
+def prune_irrelevant_edges(edges, start, end):
+    """
+    Remove edges that are not on any simple path from start to end
+
+    Dangling trees, parts hanging on a single articulation vertex and
+    cycled edges never change delay between start and end. With virtual
+    edge start-end added, edges on start-end paths are exactly the
+    biconnected component of that edge, found by one lowpoint_dfs, so
+    the pass is linear.
+    Graph where end is not reachable from start is left as is.
+
+    Arguments:
+        - edges: list of edges, changed in place
+        - start: starting vertex
+        - end: ending vertex
+
+    Returns:
+        - amount of edges removed
+    """
+    if start == end:
+        return 0
+
+    adjacency = {}
+    for i, e in enumerate(edges):
+        if e[0] != e[1]:
+            adjacency.setdefault(e[0], []).append(i)
+            adjacency.setdefault(e[1], []).append(i)
+    if start not in adjacency or end not in adjacency:
+        return 0
+
+    # DFS leaves start by virtual edge only, so end is its single child
+    # and component of the virtual edge is the one started by end
+    virtual = len(edges)
+    adjacency[start] = [virtual]
+
+    def other(i, v):
+        if i == virtual:
+            return end if v == start else start
+        return edges[i][1] if edges[i][0] == v else edges[i][0]
+
+    disc, low, parent, order = lowpoint_dfs(adjacency, other, start)
+
+    # component of tree edge into v, named by vertex its first edge enters
+    component = {end: end}
+    for v in order[2:]:
+        p = parent[v][0]
+        component[v] = v if low[v] >= disc[p] else component[p]
+
+    # edge belongs to component of its end discovered later, for back
+    # edges it is the one holding tree edge into that end
+    def relevant(e):
+        if e[0] == e[1] or e[0] not in disc or e[1] not in disc:
+            return False
+        v = e[0] if disc[e[0]] > disc[e[1]] else e[1]
+        return component[v] == end
+
+    kept = [e for e in edges if relevant(e)]
+    if not kept:
+        return 0  # end is not reachable, only virtual edge is there
+
+    removed = len(edges) - len(kept)
+    if TRACE:
+        logger.debug("Irrelevant edges removed: %s",
+                     [e for e in edges if not relevant(e)])
+    edges[:] = kept
+    return removed
 
 
 def get_degrees_dictionary(edges):
@@ -461,7 +685,52 @@ def get_degrees_dictionary(edges):
     return dd
 
 
-def optimize(edges, start, end):
+class Profiler(object):
+    """
+    Collects time and amount of reduced edges per optimization phase
+
+    Phases are named after reducing functions, e.g. "reduce_parallel".
+    Usage:
+        profiler = Profiler()
+        optimize(edges, start, end, profiler)
+        profiler.report()
+    """
+
+    def __init__(self):
+        # phase name -> [calls, seconds, edges reduced]
+        self.phases = {}
+
+    def measure(self, phase, func, *args):
+        """ Call func(*args) accounting its time and result to @phase """
+        started = time.perf_counter()
+        reduced = func(*args)
+        elapsed = time.perf_counter() - started
+
+        stats = self.phases.setdefault(phase, [0, 0.0, 0])
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += reduced or 0
+        return reduced
+
+    def report(self):
+        """ Log collected statistics, one line per phase """
+        for phase, (calls, seconds, reduced) in self.phases.items():
+            logger.info("%-22s %6i calls %10.6f s %10i edges reduced",
+                        phase, calls, seconds, reduced)
+
+
+def _call(phase, func, *args):
+    """ Call func(*args), used by optimize instead of profiler """
+    return func(*args)
+
+
+def redirect_edges(edges):
+    """ Redirect all edges alphabetically, see redirect_edge_alpabetically """
+    for edge in edges:
+        redirect_edge_alpabetically(edge)
+
+
+def optimize(edges, start, end, profiler=None, delays=DELAYS["float"]):
     """
     Optimize graph
 
@@ -469,29 +738,829 @@ def optimize(edges, start, end):
         - edges: list of edges
         - start: starting edges
         - end: ending edge
+        - profiler: optional Profiler to collect time spent per phase
+        - delays: numeric backend delays of edges are kept in,
+            see DELAYS
     """
-    for edge in edges:
-        redirect_edge_alpabetically(edge)
+    measure = profiler.measure if profiler is not None else _call
 
-    reduce_parallel(edges)
-    eliminate_zero_edges(edges, start, end)
-    reduce_sequential(edges, start, end)
+    measure("redirect_edges", redirect_edges, edges)
 
-    while True:
-        if reduce_parallel(edges) == 0:
-            break
+    measure("reduce_parallel", reduce_parallel, edges, delays)
+    measure("eliminate_zero_edges", eliminate_zero_edges, edges, start, end)
+    measure("reduce_sequential", reduce_sequential, edges, start, end)
 
-        if reduce_sequential(edges, start, end) == 0:
+    # parts off start-end paths are dropped when the network is reduced
+    # already, so the pass is cheap when nothing dangles; dropped parts
+    # held their vertexes off degree 2, so reduction is repeated then
+    # (reducing the rest never makes new dangling parts)
+    while True:
+        # each pass could make work for the other one, e.g. removing
+        # cycles makes new transitional vertexes, so stop only when
+        # both are idle
+        while True:
+            reduced = measure("reduce_parallel", reduce_parallel,
+                              edges, delays)
+            reduced += measure("reduce_sequential",
+                               reduce_sequential, edges, start, end)
+            if reduced == 0:
+                break
+        if not measure("prune_irrelevant_edges", prune_irrelevant_edges,
+                       edges, start, end):
             break
 
     logger.debug("Optimization finished.")
 
 
-def scan_edges(edges_count):
+def split_parts(edges, ids, terminals):
+    """
+    Split edges @ids into connected parts not crossing @terminals
+
+    Arguments:
+        - edges: edges by id, list or dict
+        - ids: ids of edges to split
+        - terminals: vertexes parts are not connected through
+
+    Returns:
+        - list of (edges ids, set of terminals touched) of parts,
+            edges between two terminals are parts of their own
+    """
+    adjacency = {}
+    parts = []
+    for i in ids:
+        v1, v2 = edges[i][0], edges[i][1]
+        if v1 in terminals and v2 in terminals:
+            parts.append(([i], set([v1, v2])))
+            continue
+        adjacency.setdefault(v1, []).append(i)
+        adjacency.setdefault(v2, []).append(i)
+
+    visited = set()
+    for root in adjacency:
+        if root in terminals or root in visited:
+            continue
+        visited.add(root)
+        stack = [root]
+        part = set()
+        touched = set()
+        while stack:
+            v = stack.pop()
+            for i in adjacency[v]:
+                part.add(i)
+                u = edges[i][0] if edges[i][1] == v else edges[i][1]
+                if u in terminals:
+                    touched.add(u)
+                elif u not in visited:
+                    visited.add(u)
+                    stack.append(u)
+        parts.append((list(part), touched))
+    return parts
+
+
+def cut_vertexes(edges, s, t, ids):
+    """
+    Vertexes every @s - @t path over edges @ids goes through
+
+    Returns:
+        - list of vertexes in path order, empty if there are none or
+            @s and @t are not connected
+    """
+    adjacency = {}
+    for i in ids:
+        adjacency.setdefault(edges[i][0], []).append(i)
+        adjacency.setdefault(edges[i][1], []).append(i)
+
+    def other(i, v):
+        return edges[i][0] if edges[i][1] == v else edges[i][1]
+
+    disc, low, parent, _ = lowpoint_dfs(adjacency, other, s)
+
+    if t not in disc:
+        return []
+
+    # walk tree path back from t, p separates s and t when
+    # subtree of its child on the path does not reach above p
+    cuts = []
+    v = t
+    p = parent[t][0]
+    while p != s:
+        if low[v] >= disc[p]:
+            cuts.append(p)
+        v, p = p, parent[p][0]
+    cuts.reverse()
+    return cuts
+
+
+class DecompositionNode(object):
+    """
+    Part of network between terminals @s and @t in decomposition tree
+
+    Kinds of parts:
+        - "E": single cable with id @ids[0]
+        - "B": block of @children parts that is not series-parallel,
+            reduced by optimize
+        - "P": two @children between @s and @t in parallel
+        - "S": @children from @s to @m and from @m to @t in series
+
+    Reduced part is kept as @delay of direct s-t edge (None if there is
+    none) and tuple of @extra edges, only blocks leave them.
+    """
+
+    __slots__ = ("kind", "s", "t", "m", "ids", "children", "parent",
+                 "delay", "extra")
+
+    def __init__(self, kind, s, t, ids=(), children=(), m=None):
+        self.kind = kind
+        self.s = s
+        self.t = t
+        self.m = m
+        self.ids = ids
+        self.children = children
+        self.parent = None
+        self.delay = None
+        self.extra = ()
+
+    def edges(self):
+        """ Reduced part as tuple of (v1, v2, delay) edges """
+        if self.delay is None:
+            return self.extra
+        return ((self.s, self.t, self.delay),) + self.extra
+
+
+class IncrementalOptimizer(object):
+    """
+    Optimizer that keeps reduction state between cabling changes
+
+    Network is kept as series-parallel decomposition tree of
+    DecompositionNode: leaves are cables, inner nodes join two parts in
+    parallel or in series, or several parts into a block that is not
+    series-parallel (e.g. a bridge). Long chains and wide bundles are
+    joined as balanced binary trees. Every node keeps reduced delay of its
+    part, so:
+        - changing delay recomputes nodes on the path from the cable to
+          the root (blocks on the path are reduced again by optimize)
+        - removing cable drops its leaf: parallel join is replaced by the
+          other branch, broken series part is detached, block is
+          decomposed again from its parts
+        - adding cable between terminals of a part joins it to the part
+          in parallel, otherwise the smallest part containing its ends is
+          decomposed again; only parts on the way down to the ends are
+          opened, others are taken as they are, like single cables
+    Parts hanging on a single vertex are kept aside and attached back
+    when new cable connects them to the network again.
+
+    Arguments:
+        - edges: list of raw edges, e.g. [['a', 'b', 5], ['a', 'c', 5], ... ]
+            ids of these edges are their indexes in the list
+        - start: starting vertex, e.g. 'a'
+        - end: ending vertex, e.g. 'b'
+        - delays: numeric backend delays of edges are kept in, see DELAYS
+        - max_depth: deeper nested parts are kept as blocks
+    """
+
+    def __init__(self, edges, start, end, delays=DELAYS["float"],
+                 max_depth=200):
+        self.start = start
+        self.end = end
+        self.delays = delays
+        self.max_depth = max_depth
+        self.raw = {}    # raw edge id -> [v1, v2, delay]
+        self.nodes = {}  # raw edge id -> its leaf, if it is in network
+        self.owner = {start: None, end: None}  # vertex -> node it is inner in
+        self.loose = {}  # vertex -> ids of dangling edges on it
+        self._ends = {}  # part -> its terminals, while decomposing
+        self._next_id = 0
+
+        for e in edges:
+            self._register(e[0], e[1], e[2])
+        self.root = self._build(start, end,
+                                [self._leaf(i) for i in self.raw])
+
+    def result(self):
+        """
+        Returns reduced graph as list of plain edges
+
+        Edges left by blocks are reduced together once more by optimize,
+        it costs size of the result only.
+        """
+        if self.root is None:
+            # start and end are not connected, there is nothing to keep
+            edges = [e[:] for e in self.raw.values()]
+        else:
+            edges = [list(e) for e in self.root.edges()]
+            if len(edges) == 1:
+                redirect_edge_alpabetically(edges[0])
+                return edges
+        optimize(edges, self.start, self.end, delays=self.delays)
+        return edges
+
+    def add_edge(self, v1, v2, delay):
+        """
+        Add cable to the graph
+
+        Returns:
+            - id of new edge to refer it in following updates
+        """
+        i = self._register(v1, v2, delay)
+        if v1 == v2:
+            self._dangle([i])
+            return i
+
+        # dangling edges reachable from the cable through vertexes off the
+        # network join it, network vertexes they reach are attachments
+        part = [i]
+        attached = set()
+        queue = []
+        for v in (v1, v2):
+            if v in self.owner:
+                attached.add(v)
+            else:
+                queue.append(v)
+        visited = set(queue)
+        while queue:
+            v = queue.pop()
+            for j in self.loose.get(v, ()):
+                if j in visited:
+                    continue
+                visited.add(j)
+                part.append(j)
+                for u in self.raw[j][:2]:
+                    if u in self.owner:
+                        attached.add(u)
+                    elif u not in visited:
+                        visited.add(u)
+                        queue.append(u)
+
+        if len(attached) < 2:
+            self._dangle([i])  # still hangs on a single vertex
+            return i
+
+        for j in part[1:]:
+            self._undangle(j)
+        pieces = [self._leaf(j) for j in part]
+        node = self._lowest_node(attached)
+        if node is None:
+            self.root = self._build(self.start, self.end, pieces)
+        elif attached == set([node.s, node.t]):
+            branch = self._build(node.s, node.t, pieces)
+            joined = DecompositionNode("P", node.s, node.t,
+                                       children=(node, branch))
+            self._update(joined)
+            self._replace(node, joined)
+            node.parent = branch.parent = joined
+        else:
+            pieces.extend(self._open(node, attached))
+            self._replace(node, self._build(node.s, node.t, pieces))
+        return i
+
+    def remove_edge(self, i):
+        """ Remove cable with id @i from the graph """
+        node = self.nodes.pop(i, None)
+        if node is None:
+            self._undangle(i)
+        else:
+            self._replace(node, None)
+        del self.raw[i]
+
+    def change_delay(self, i, delay):
+        """ Set delay of cable with id @i """
+        self.raw[i][2] = delay
+        node = self.nodes.get(i)
+        if node is not None:  # dangling cable does not matter
+            self._recompute(node)
+
+    def _register(self, v1, v2, delay):
+        i = self._next_id
+        self._next_id += 1
+        self.raw[i] = [v1, v2, delay]
+        return i
+
+    def _leaf(self, i):
+        node = DecompositionNode("E", self.raw[i][0], self.raw[i][1],
+                                 ids=(i,))
+        self.nodes[i] = node
+        self._update(node)
+        return node
+
+    def _dangle(self, ids):
+        for i in ids:
+            for v in set(self.raw[i][:2]):
+                self.loose.setdefault(v, set()).add(i)
+
+    def _undangle(self, i):
+        for v in set(self.raw[i][:2]):
+            self.loose[v].discard(i)
+            if not self.loose[v]:
+                del self.loose[v]
+
+    def _drop(self, parts):
+        """ Leave @parts dangling """
+        for part in parts:
+            self._dangle(self._collect(part))
+
+    def _build(self, s, t, parts):
+        """
+        Decompose network of @parts between @s and @t
+
+        Parts are leaves or subtrees kept from previous decomposition,
+        taken as single cables between their terminals. Parts off s-t
+        paths are left dangling.
+
+        Returns:
+            - root DecompositionNode of the network, None if @s and @t
+                are not connected
+        """
+        self._drop([p for p in parts if p.s == p.t])
+        self._ends = dict((p, (p.s, p.t)) for p in parts if p.s != p.t)
+        try:
+            return self._parallel(s, t, list(self._ends), 0)
+        finally:
+            self._ends = {}
+
+    def _parallel(self, s, t, parts, depth):
+        branches = []
+        for part, touched in split_parts(self._ends, parts, (s, t)):
+            if len(touched) < 2:
+                self._drop(part)
+            elif len(part) == 1:
+                branches.append(part[0])
+            else:
+                branches.append(self._series(s, t, part, depth + 1))
+        if not branches:
+            return None
+        return self._join(branches, [s, t])
+
+    def _series(self, s, t, parts, depth):
+        if depth > self.max_depth:
+            return self._block(s, t, parts)
+
+        cuts = cut_vertexes(self._ends, s, t, parts)
+        if not cuts:
+            return self._block(s, t, parts)
+
+        terminals = [s] + cuts + [t]
+        position = dict((v, k) for k, v in enumerate(terminals))
+        segments = [[] for _ in range(len(terminals) - 1)]
+        for part, touched in split_parts(self._ends, parts, position):
+            if len(touched) < 2:
+                self._drop(part)
+                continue
+            segments[min(position[v] for v in touched)].extend(part)
+
+        return self._join([self._parallel(terminals[k], terminals[k + 1],
+                                          segments[k], depth + 1)
+                           for k in range(len(segments))], terminals)
+
+    def _block(self, s, t, parts):
+        node = DecompositionNode("B", s, t, children=tuple(parts))
+        for part in parts:
+            part.parent = node
+            for v in (part.s, part.t):
+                if v != s and v != t:
+                    self.owner[v] = node
+        self._update(node)
+        return node
+
+    def _join(self, parts, terminals):
+        """
+        Join @parts into balanced tree of binary nodes
+
+        With two @terminals parts are parallel branches between them,
+        otherwise part k goes from terminals[k] to terminals[k + 1].
+        """
+        def join(lo, hi):
+            if hi - lo == 1:
+                return parts[lo]
+            mid = (lo + hi) // 2
+            children = (join(lo, mid), join(mid, hi))
+            if len(terminals) == 2:
+                node = DecompositionNode("P", terminals[0], terminals[1],
+                                         children=children)
+            else:
+                node = DecompositionNode("S", terminals[lo], terminals[hi],
+                                         children=children, m=terminals[mid])
+                self.owner[node.m] = node
+            for child in children:
+                child.parent = node
+            self._update(node)
+            return node
+
+        return join(0, len(parts))
+
+    def _update(self, node):
+        """ Reduce part of @node from reduced parts of its children """
+        if node.kind == "E":
+            node.delay = self.raw[node.ids[0]][2]
+        elif node.kind == "B":
+            sub = [list(e) for part in node.children for e in part.edges()]
+            optimize(sub, node.s, node.t, delays=self.delays)
+            node.delay = None
+            extra = []
+            for e in sub:
+                if node.delay is None and set(e[:2]) == set([node.s, node.t]):
+                    node.delay = e[2]
+                else:
+                    extra.append(tuple(e))
+            node.extra = tuple(extra) if node.delay != 0 else ()
+        elif node.kind == "P":
+            a, b = node.children
+            if a.delay is None or b.delay is None:
+                node.delay = b.delay if a.delay is None else a.delay
+            elif a.delay == 0 or b.delay == 0:
+                node.delay = a.delay if a.delay == 0 else b.delay
+            else:
+                node.delay = self.delays.parallel(a.delay, b.delay)
+            # part shorted by zero cable does not affect delay any more
+            node.extra = a.extra + b.extra if node.delay != 0 else ()
+        else:
+            a, b = node.children
+            if a.extra or b.extra:
+                node.delay = None
+                node.extra = a.edges() + b.edges()
+            else:
+                node.delay = a.delay + b.delay
+                node.extra = ()
+
+    def _recompute(self, node):
+        """ Update @node and all nodes on the path to the root """
+        while node is not None:
+            self._update(node)
+            node = node.parent
+
+    def _replace(self, old, new):
+        """
+        Put part @new in place of @old and recompute path to the root
+
+        @new is None when @old does not connect its terminals any more:
+        parallel join is replaced by the other branch, series join is
+        broken as well and the rest of it is left dangling, block is
+        decomposed again without @old.
+        """
+        parent = old.parent
+        while new is None and parent is not None:
+            others = [c for c in parent.children if c is not old]
+            if parent.kind == "P":
+                new = others[0]
+            elif parent.kind == "S":
+                self._drop(others)
+                self.owner.pop(parent.m, None)
+            else:
+                self._disown(parent)
+                new = self._build(parent.s, parent.t, others)
+            old, parent = parent, parent.parent
+
+        if new is not None:
+            new.parent = parent
+        if parent is None:
+            self.root = new
+        else:
+            parent.children = tuple(new if c is old else c
+                                    for c in parent.children)
+            self._recompute(parent)
+
+    def _disown(self, node):
+        """ Forget vertexes inner in block @node """
+        for part in node.children:
+            for v in (part.s, part.t):
+                if self.owner.get(v) is node:
+                    del self.owner[v]
+
+    def _collect(self, node):
+        """ Detach subtree of @node, returns ids of its raw edges """
+        ids = []
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.kind == "S":
+                self.owner.pop(n.m, None)
+            elif n.kind == "B":
+                self._disown(n)
+            elif n.kind == "E":
+                self.nodes.pop(n.ids[0], None)
+                ids.append(n.ids[0])
+            stack.extend(n.children)
+        return ids
+
+    def _open(self, node, vertexes):
+        """
+        Split @node into parts to decompose again with new cables
+
+        Only parts @vertexes are inner in are opened, together with parts
+        above them, others are kept whole.
+
+        Returns:
+            - list of parts
+        """
+        opened = set([node])
+        for v in vertexes:
+            chain = []
+            n = self.owner[v]
+            while n is not None and n is not node:
+                chain.append(n)
+                n = n.parent
+            if n is node:
+                opened.update(chain)
+
+        parts = []
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            if n.kind == "E" or n not in opened:
+                parts.append(n)
+                continue
+            if n.kind == "S":
+                self.owner.pop(n.m, None)
+            elif n.kind == "B":
+                self._disown(n)
+            stack.extend(n.children)
+        return parts
+
+    def _lowest_node(self, vertexes):
+        """ Smallest part containing all @vertexes, None without network """
+        if self.root is None:
+            return None
+
+        # vertex is in the part it is inner in, in all parts above it and
+        # in parts it is a terminal of
+        chains = []
+        for v in vertexes:
+            chain = set()
+            node = self.owner[v]
+            while node is not None:
+                chain.add(node)
+                node = node.parent
+            chains.append((v, chain))
+
+        node = self.root
+        while True:
+            for child in node.children:
+                if all(child in chain or v == child.s or v == child.t
+                       for v, chain in chains):
+                    node = child
+                    break
+            else:
+                return node
+
+
+class ReductionCache(object):
+    """
+    LRU cache of reduced sub-networks by their canonical keys
+
+    Keys do not depend on vertexes names, so identical sub-networks
+    (e.g. racks of the same template) share one record. With @path given
+    records are also kept in a shelve file and reused by following runs.
+
+    Arguments:
+        - max_size: amount of records kept in memory
+        - path: optional path of on-disk cache file
+    """
+
+    def __init__(self, max_size=100000, path=None):
+        self.max_size = max_size
+        self.records = OrderedDict()
+        self.disk = shelve.open(path) if path else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Returns cached value of @key or None """
+        value = self.records.get(key)
+        if value is not None:
+            self.records.move_to_end(key)
+        elif self.disk is not None and key in self.disk:
+            value = self.disk[key]
+            self._remember(key, value)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """ Store @value of @key in memory (and on disk if enabled) """
+        self._remember(key, value)
+        if self.disk is not None:
+            self.disk[key] = value
+
+    def close(self):
+        """ Flush and close on-disk cache """
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+
+    def _remember(self, key, value):
+        self.records[key] = value
+        self.records.move_to_end(key)
+        while len(self.records) > self.max_size:
+            self.records.popitem(last=False)
+
+
+def _digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class MemoizedReducer(object):
+    """
+    Series-parallel decomposition of graph with memoized reductions
+
+    Network between two terminals is split into parallel branches
+    (connected parts left after removing terminals) and each branch into
+    series segments (by vertexes every terminal-terminal path goes through).
+    Every part gets canonical key built from keys of its parts, e.g.
+    P(S(E:2,E:2),E:4), hashed to fixed length. Blocks that could not be
+    split further are reduced by optimize and keyed by their edges with
+    vertexes numbered in BFS order from terminal. Parts hanging on a single
+    vertex do not affect delay and are dropped. Keys are stored in cache
+    with name and scale of numeric backend, so e.g. results of fixed point
+    reduction are never served to float one.
+
+    Recognizing a part costs a pass over its edges, so within one graph
+    cache mostly saves optimize runs on repeated non series-parallel
+    blocks, across runs it saves reduction of any seen part. Whole network
+    already reduced with the same cache is served without the walk. On
+    series-parallel networks seen for the first time it is slower than
+    optimize.
+
+    Arguments:
+        - cache: ReductionCache, shared between reducers/runs
+        - delays: numeric backend, see DELAYS
+        - max_depth: deeper nested parts are reduced by optimize as whole
+    """
+
+    def __init__(self, cache=None, delays=DELAYS["float"], max_depth=200):
+        self.cache = cache if cache is not None else ReductionCache()
+        self.delays = delays
+        self.max_depth = max_depth
+        self.edges = []
+        self.prefix = "%s/%s:" % (delays.name, delays.scale)
+
+    def reduce(self, edges, start, end):
+        """
+        Reduce network between @start and @end
+
+        Arguments:
+            - edges: list of edges, replaced by reduced ones in place
+
+        Returns:
+            - amount of edges reduced
+        """
+        count = len(edges)
+        # whole network is keyed by its edges as they are, so repeated
+        # runs on the same input skip decomposition walk
+        network = _digest("I(%r,%r,%r)" % (start, end, edges))
+        reduced = self._get(network)
+        if reduced is not None:
+            edges[:] = [list(e) for e in reduced]
+            return count - len(edges)
+
+        self.edges = edges
+        ids = [i for i in range(len(edges)) if edges[i][0] != edges[i][1]]
+        _, delay, reduced = self._parallel(start, end, ids, 0)
+
+        if reduced is None:
+            reduced = [[start, end, delay]]
+        else:
+            # edges left by blocks are reduced with their neighbours,
+            # e.g. series segments next to a block
+            optimize(reduced, start, end, delays=self.delays)
+        for e in reduced:
+            redirect_edge_alpabetically(e)
+        edges[:] = reduced
+        self.edges = []
+        self._put(network, [tuple(e) for e in reduced])
+        return count - len(edges)
+
+    def _get(self, key):
+        return self.cache.get(self.prefix + key)
+
+    def _put(self, key, value):
+        self.cache.put(self.prefix + key, value)
+
+    def _parallel(self, s, t, ids, depth):
+        """ Reduce network between @s and @t as parallel branches """
+        branches = []
+        for part, touched in split_parts(self.edges, ids, (s, t)):
+            if len(touched) < 2:
+                continue  # dangling part
+            if len(part) == 1:
+                branches.append(self._leaf(part[0]))
+            else:
+                branches.append(self._series(s, t, part, depth + 1))
+
+        if len(branches) == 1:
+            return branches[0]
+        if not branches:
+            return _digest("N"), None, []  # s and t are not connected
+        key = _digest("P(%s)" % ",".join(sorted(b[0] for b in branches)))
+
+        delays = [b[1] for b in branches if b[2] is None]
+        delay = None
+        if delays:
+            delay = self._get(key) if len(delays) == len(branches) \
+                else None
+            if delay is None:
+                delay = delays[0]
+                for d in delays[1:]:
+                    delay = 0 if delay == 0 or d == 0 \
+                        else self.delays.parallel(delay, d)
+        if len(delays) == len(branches):
+            self._put(key, delay)
+            return key, delay, None
+
+        reduced = [e for b in branches if b[2] is not None for e in b[2]]
+        if delay is not None:
+            reduced.append([s, t, delay])
+        return key, None, reduced
+
+    def _series(self, s, t, ids, depth):
+        """ Reduce connected branch between @s and @t as series segments """
+        if depth > self.max_depth:
+            return self._block(s, t, ids)
+
+        cuts = cut_vertexes(self.edges, s, t, ids)
+        if not cuts:
+            return self._block(s, t, ids)
+
+        terminals = [s] + cuts + [t]
+        position = dict((v, k) for k, v in enumerate(terminals))
+        segments = [[] for _ in range(len(terminals) - 1)]
+        for part, touched in split_parts(self.edges, ids, position):
+            if len(touched) < 2:
+                continue  # dangling part
+            k = min(position[v] for v in touched)
+            segments[k].extend(part)
+
+        results = [self._parallel(terminals[k], terminals[k + 1],
+                                  segments[k], depth + 1)
+                   for k in range(len(segments))]
+
+        keys = [r[0] for r in results]
+        key = _digest("S(%s)" % ",".join(min(keys, keys[::-1])))
+        if all(r[2] is None for r in results):
+            delay = self._get(key)
+            if delay is None:
+                delay = sum(r[1] for r in results)
+                self._put(key, delay)
+            return key, delay, None
+
+        reduced = []
+        for k, r in enumerate(results):
+            if r[2] is None:
+                reduced.append([terminals[k], terminals[k + 1], r[1]])
+            else:
+                reduced.extend(r[2])
+        return key, None, reduced
+
+    def _leaf(self, i):
+        delay = self.edges[i][2]
+        return "E:%r" % (delay,), delay, None
+
+    def _block(self, s, t, ids):
+        """ Reduce block that is not split further by optimize """
+        edges = self.edges
+        adjacency = {}
+        for i in ids:
+            adjacency.setdefault(edges[i][0], []).append(i)
+            adjacency.setdefault(edges[i][1], []).append(i)
+
+        # number vertexes in BFS order from s, t is always 1
+        labels = {s: 0, t: 1}
+        names = [s, t]
+        queue = deque([s, t])
+        while queue:
+            v = queue.popleft()
+            for i in adjacency[v]:
+                u = edges[i][0] if edges[i][1] == v else edges[i][1]
+                if u not in labels:
+                    labels[u] = len(names)
+                    names.append(u)
+                    queue.append(u)
+
+        labeled = sorted((min(labels[edges[i][0]], labels[edges[i][1]]),
+                          max(labels[edges[i][0]], labels[edges[i][1]]),
+                          edges[i][2]) for i in ids)
+        key = _digest("G(%r)" % (labeled,))
+
+        reduced = self._get(key)
+        if reduced is None:
+            sub = [[names[l1], names[l2], d] for l1, l2, d in labeled]
+            optimize(sub, s, t, delays=self.delays)
+            reduced = [(labels[e[0]], labels[e[1]], e[2]) for e in sub]
+            self._put(key, reduced)
+
+        if len(reduced) == 1 and set(reduced[0][:2]) == set([0, 1]):
+            return key, reduced[0][2], None
+        return key, None, [[names[l1], names[l2], d]
+                           for l1, l2, d in reduced]
+
+
+def scan_edges(edges_count, delays=DELAYS["float"]):
     """ scans edges data from user input
 
     Arguments:
         - edges amount to scan
+        - delays: numeric backend to convert delays to
 
     Returns:
         - list of edges, example: [["a", "e", 2], ["e", "b", 2], ...]
@@ -502,7 +1571,7 @@ def scan_edges(edges_count):
         edge = input("Enter edge:").split(" ")
 
         try:
-            edge[2] = int(edge[2])
+            edge[2] = delays.delay(int(edge[2]))
         except ValueError:
             raise ValueError("Input data parsing error, "
                              "the format should be like \"s s 3\"")
@@ -512,34 +1581,80 @@ def scan_edges(edges_count):
     return edges
 
 
-def print_output(edges):
+def print_output(edges, delays=DELAYS["float"]):
     """ prints output in format of edge input """
     for edge in edges:
-        print("{} {} {}".format(edge[0], edge[1], int(edge[2])))
-
+        print("{} {} {}".format(edge[0], edge[1], delays.format(edge[2])))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Reduce network of cables read from standard input')
+    parser.add_argument('--profile', action='store_true',
+                        help='report time spent in each optimization phase')
+    parser.add_argument('--delays', choices=sorted(DELAYS), default='float',
+                        help='delays arithmetic: float (fast), '
+                             'fraction (exact) or fixed (fixed point)')
+    parser.add_argument('--memoize', action='store_true',
+                        help='reduce by series-parallel decomposition '
+                             'reusing results of identical sub-networks; '
+                             'pays off on repeated non series-parallel '
+                             'blocks and on repeated runs with --cache, '
+                             'slower than plain reduction otherwise')
+    parser.add_argument('--cache', metavar='PATH', default=None,
+                        help='keep memoized results in file between runs '
+                             '(implies --memoize)')
+    return parser.parse_args()
+
+
+def run(version=1, profile=False, delays="float",
+        memoize=False, cache_path=None):
+    """
+    Main method ask for user input, perform task, print output
 
-def run(version=1):
-    """ Main method ask for user input, perform task, print output """
+    Arguments:
+        - profile: report time spent in each optimization phase
+        - delays: name of numeric backend, see DELAYS
+        - memoize: reduce with MemoizedReducer instead of optimize
+        - cache_path: on-disk cache file of MemoizedReducer
+    """
+    delays = DELAYS[delays]
 
     # scan header to define our graph parameters
     try:
         header = input("Enter graph header:")
         edges_count, start_edge, finish_edge = header.split(" ")
         edges_count = int(edges_count)
-        logger.debug("Scanned edges count: {}; Start:{}, End:{}".format(
-            edges_count, start_edge, finish_edge))
+        logger.debug("Scanned edges count: %s; Start:%s, End:%s",
+                     edges_count, start_edge, finish_edge)
     except ValueError:
         raise ValueError("Input data parsing error, "
                          "the format should be like \"3 a b\"")
 
     # scan edges
-    edges = scan_edges(edges_count)
-    logger.debug("Scanned edges: {}".format(edges))
+    edges = scan_edges(edges_count, delays)
+    if TRACE:
+        logger.debug("Scanned edges: %s", edges)
+
+    profiler = Profiler() if profile else None
+    if memoize or cache_path:
+        cache = ReductionCache(path=cache_path)
+        reducer = MemoizedReducer(cache, delays)
+        measure = profiler.measure if profiler is not None else _call
+        measure("memoized_reduce",
+                reducer.reduce, edges, start_edge, finish_edge)
+        logger.debug("Cache hits: %s, misses: %s", cache.hits, cache.misses)
+        cache.close()
+    else:
+        optimize(edges, start_edge, finish_edge, profiler, delays)
 
-    optimize(edges, start_edge, finish_edge)
+    print_output(edges, delays)
 
-    print_output(edges)
+    if profiler is not None:
+        profiler.report()
 
 
 if __name__ == "__main__":
-    run()
+    args = parse_arguments()
+    run(profile=args.profile, delays=args.delays,
+        memoize=args.memoize, cache_path=args.cache)
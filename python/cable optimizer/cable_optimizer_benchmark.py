@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+"""
+    Cable optimizer benchmark.
+
+    Generates random series-parallel networks of cables and measures time
+    and memory spent by each phase of cable_optimizer.optimize on them.
+
+    Generated network reduces to a single start-end edge, so the whole
+    reduction loop is exercised. With --bridge-ratio some edges grow into
+    Wheatstone bridges, which are not series-parallel and stay in result.
+    Parts shorted by zero cables are left hanging on a single vertex, they
+    are dropped by prune_irrelevant_edges.
+    Network could be written to a file in cable_optimizer input format to
+    be used as a fixture:
+
+        python3 cable_optimizer_benchmark.py --write net.txt 100000
+        python3 cable_optimizer.py --profile < net.txt
+
+    Benchmark several sizes and fail if time grows faster than n^1.5:
+
+        python3 cable_optimizer_benchmark.py --max-exponent 1.5 1000 10000
+        python3 cable_optimizer_benchmark.py --bridge-ratio 0.1 100000
+"""
+
+import argparse
+import math
+import random
+import sys
+import time
+import tracemalloc
+from array import array
+
+# add current folder to system path
+import os
+import inspect
+
+cmd_folder = os.path.realpath(os.path.abspath(os.path.split(
+    inspect.getfile(inspect.currentframe()))[0]))
+if cmd_folder not in sys.path:
+    sys.path.insert(0, cmd_folder)
+
+import cable_optimizer
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+
+def generate_network(edges_count, start="a", end="b", seed=None,
+                     parallel_ratio=0.4, max_bundle=4, max_chain=8,
+                     zero_ratio=0.05, max_delay=100, bridge_ratio=0):
+    """
+    Generate random network between @start and @end
+
+    Network grows from a single start-end edge: random edge is either
+    split into a chain of up to @max_chain edges (series) or gets up to
+    @max_bundle parallel edges, until @edges_count edges are there.
+    With @bridge_ratio edge could also become a Wheatstone bridge
+    (u-x, u-y, x-y, x-w, y-w for edge u-w), then network is not
+    series-parallel any more.
+    Endpoints are kept in int arrays, so 10^7 edges fit in memory.
+
+    Arguments:
+        - edges_count: amount of edges to generate
+        - start: starting vertex
+        - end: ending vertex
+        - seed: random seed, same seed gives same network
+        - parallel_ratio: probability to grow parallel bundle
+        - max_bundle: max amount of edges added to a bundle at once
+        - max_chain: max amount of edges in a chain made at once
+        - zero_ratio: share of zero delay cables
+        - max_delay: delays are chosen from 1..max_delay
+        - bridge_ratio: probability to grow bridge instead of chain/bundle
+
+    Returns:
+        - generator of edges, e.g. ["a", "v1", 5], ["v1", "b", 0], ...
+    """
+    rnd = random.Random(seed)
+
+    # vertex 0 is start, 1 is end, others are named "v<number>"
+    v1 = array("l", [0])
+    v2 = array("l", [1])
+    vertexes = 2
+
+    while len(v1) < edges_count:
+        i = rnd.randrange(len(v1))
+        left = edges_count - len(v1)
+
+        if bridge_ratio and left >= 4 and rnd.random() < bridge_ratio:
+            # edge i becomes u-x, x-y is the bridge between u-y-w and x-w
+            u, w = v1[i], v2[i]
+            x, y = vertexes, vertexes + 1
+            vertexes += 2
+            v2[i] = x
+            for a, b in ((u, y), (x, y), (x, w), (y, w)):
+                v1.append(a)
+                v2.append(b)
+        elif rnd.random() < parallel_ratio:
+            for _ in range(min(rnd.randint(1, max_bundle), left)):
+                v1.append(v1[i])
+                v2.append(v2[i])
+        else:
+            # edge i becomes first edge of a chain ending in old v2[i]
+            last = v2[i]
+            chain = min(rnd.randint(2, max(max_chain, 2)), left + 1)
+            v2[i] = vertexes
+            for k in range(chain - 1):
+                v1.append(vertexes)
+                vertexes += 1
+                v2.append(vertexes if k < chain - 2 else last)
+
+    names = {0: start, 1: end}
+    for i in range(len(v1)):
+        if rnd.random() < zero_ratio:
+            delay = 0
+        else:
+            delay = rnd.randint(1, max_delay)
+        yield [names.get(v1[i]) or "v%i" % v1[i],
+               names.get(v2[i]) or "v%i" % v2[i],
+               delay]
+
+
+def write_input(path, edges_count, start="a", end="b", **kwargs):
+    """ Write generated network to @path in cable_optimizer input format """
+    with open(path, "w") as f:
+        f.write("%i %s %s\n" % (edges_count, start, end))
+        for edge in generate_network(edges_count, start, end, **kwargs):
+            f.write("%s %s %i\n" % tuple(edge))
+
+
+def max_rss_mb():
+    """ Peak resident memory of the process in Mb, None if unknown """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return rss / 2.0 ** 20  # bytes
+    return rss / 2.0 ** 10  # kilobytes
+
+
+def benchmark(edges_count, repeat=1, trace_memory=False, delays="float",
+              **kwargs):
+    """
+    Optimize generated network and collect statistics
+
+    Arguments:
+        - edges_count: size of generated network
+        - repeat: amount of runs, the fastest one is reported
+        - trace_memory: measure peak memory allocated by optimize with
+            tracemalloc (makes optimize several times slower)
+        - delays: name of numeric backend, see cable_optimizer.DELAYS
+        - kwargs: generate_network arguments
+
+    Returns:
+        - dict with "edges", "result", "seconds", "peak_mb" and "phases",
+            where phases are Profiler.phases of the best run
+    """
+    delays = cable_optimizer.DELAYS[delays]
+    best = None
+    for _ in range(repeat):
+        edges = list(generate_network(edges_count, **kwargs))
+        for edge in edges:
+            edge[2] = delays.delay(edge[2])
+        start = kwargs.get("start", "a")
+        end = kwargs.get("end", "b")
+
+        profiler = cable_optimizer.Profiler()
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        cable_optimizer.optimize(edges, start, end, profiler, delays)
+        seconds = time.perf_counter() - started
+        peak_mb = None
+        if trace_memory:
+            peak_mb = tracemalloc.get_traced_memory()[1] / 2.0 ** 20
+            tracemalloc.stop()
+
+        if best is None or seconds < best["seconds"]:
+            best = {"edges": edges_count,
+                    "result": len(edges),
+                    "seconds": seconds,
+                    "peak_mb": peak_mb,
+                    "phases": profiler.phases}
+    return best
+
+
+def print_report(stats):
+    """ Print benchmark statistics of one network size """
+    print("edges: %i -> %i, total %.6f s" % (
+        stats["edges"], stats["result"], stats["seconds"]))
+    for phase, (calls, seconds, reduced) in stats["phases"].items():
+        print("    %-22s %6i calls %10.6f s %10i edges reduced" % (
+            phase, calls, seconds, reduced))
+    if stats["peak_mb"] is not None:
+        print("    optimize peak memory: %.1f Mb" % stats["peak_mb"])
+    rss = max_rss_mb()
+    if rss is not None:
+        print("    process max rss: %.1f Mb" % rss)
+
+
+def scaling_exponent(smaller, bigger):
+    """ Estimate k in time ~ n^k from statistics of two sizes """
+    if smaller["seconds"] <= 0 or bigger["edges"] == smaller["edges"]:
+        return 0.0
+    return (math.log(bigger["seconds"] / smaller["seconds"]) /
+            math.log(float(bigger["edges"]) / smaller["edges"]))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Benchmark cable optimizer on generated networks')
+    parser.add_argument('sizes', metavar='N', type=int, nargs='+',
+                        help='amount of edges in generated networks')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='runs per size, best one is reported')
+    parser.add_argument('--parallel-ratio', type=float, default=0.4)
+    parser.add_argument('--max-bundle', type=int, default=4)
+    parser.add_argument('--max-chain', type=int, default=8)
+    parser.add_argument('--zero-ratio', type=float, default=0.05)
+    parser.add_argument('--bridge-ratio', type=float, default=0,
+                        help='probability to grow Wheatstone bridge, '
+                             'non zero makes network not series-parallel')
+    parser.add_argument('--delays', default='float',
+                        choices=sorted(cable_optimizer.DELAYS),
+                        help='numeric backend of delays')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure optimize peak memory (slow)')
+    parser.add_argument('--max-exponent', type=float, default=None,
+                        help='fail if time grows faster than n^k '
+                             'between consecutive sizes')
+    parser.add_argument('--write', metavar='PATH', default=None,
+                        help='write network of first size to file and exit')
+    return parser.parse_args()
+
+
+def run():
+    """ Run benchmark for sizes from command line """
+    args = parse_arguments()
+    options = dict(seed=args.seed,
+                   parallel_ratio=args.parallel_ratio,
+                   max_bundle=args.max_bundle,
+                   max_chain=args.max_chain,
+                   zero_ratio=args.zero_ratio,
+                   bridge_ratio=args.bridge_ratio)
+
+    if args.write:
+        write_input(args.write, args.sizes[0], **options)
+        return 0
+
+    previous = None
+    failed = False
+    for size in args.sizes:
+        stats = benchmark(size, args.repeat, args.trace_memory,
+                          args.delays, **options)
+        print_report(stats)
+
+        if previous is not None:
+            k = scaling_exponent(previous, stats)
+            print("    scaling: time ~ n^%.2f" % k)
+            if args.max_exponent is not None and k > args.max_exponent:
+                print("    FAILED: expected at most n^%.2f" %
+                      args.max_exponent)
+                failed = True
+        previous = stats
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+This module contains implementations for
+cable optimizer benchmark unit test
+"""
+
+import unittest
+
+# add current folder to system path
+import os
+import sys
+import inspect
+import tempfile
+
+cmd_folder = os.path.realpath(os.path.abspath(os.path.split(
+    inspect.getfile(inspect.currentframe()))[0]))
+if cmd_folder not in sys.path:
+    sys.path.insert(0, cmd_folder)
+
+import cable_optimizer
+import cable_optimizer_benchmark
+
+
+class GenerateNetworkTest(unittest.TestCase):
+    """ unit test for generated networks """
+
+    def test_edges_count(self):
+        edges = list(cable_optimizer_benchmark.generate_network(1000, seed=1))
+        self.assertEqual(1000, len(edges))
+
+    def test_same_seed(self):
+        gen = cable_optimizer_benchmark.generate_network
+        self.assertEqual(list(gen(100, seed=3)), list(gen(100, seed=3)))
+
+    def test_reduces_to_single_edge(self):
+        for seed in range(20):
+            edges = list(cable_optimizer_benchmark.generate_network(
+                500, seed=seed, zero_ratio=0))
+            cable_optimizer.optimize(edges, 'a', 'b')
+            self.assertEqual(1, len(edges))
+            self.assertEqual(['a', 'b'], edges[0][:2])
+
+    def test_bridges(self):
+        gen = cable_optimizer_benchmark.generate_network
+        self.assertEqual(list(gen(100, seed=3)),
+                         list(gen(100, seed=3, bridge_ratio=0)))
+
+        for seed in range(5):
+            edges = list(gen(3000, seed=seed, zero_ratio=0,
+                             bridge_ratio=0.2))
+            self.assertEqual(3000, len(edges))
+            cable_optimizer.optimize(edges, 'a', 'b')
+            self.assertTrue(len(edges) > 1)  # bridges are not reduced
+
+    def test_write_input(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            cable_optimizer_benchmark.write_input(path, 10, seed=1)
+            with open(path) as f:
+                lines = f.read().splitlines()
+        finally:
+            os.remove(path)
+
+        self.assertEqual("10 a b", lines[0])
+        self.assertEqual(11, len(lines))
+
+    def test_benchmark(self):
+        stats = cable_optimizer_benchmark.benchmark(200, seed=1,
+                                                    trace_memory=True)
+        self.assertEqual(200, stats["edges"])
+        self.assertTrue(stats["peak_mb"] > 0)
+        self.assertIn("reduce_parallel", stats["phases"])
+
+
+if __name__ == "__main__":
+    unittest.main()
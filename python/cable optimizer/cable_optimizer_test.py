@@ -11,6 +11,8 @@ import unittest
 import os
 import sys
 import inspect
+import shutil
+import tempfile
 
 cmd_folder = os.path.realpath(os.path.abspath(os.path.split(
     inspect.getfile(inspect.currentframe()))[0]))
@@ -81,6 +83,328 @@ class CableOptimizerTest(unittest.TestCase):
         cable_optimizer.optimize(res, 'a', 'b')
         self.assertEqual(exp, res)
 
+    def test_optimize_chain(self):
+        res = [['a', 'x', 1], ['x', 'y', 2], ['y', 'b', 3]]
+        cable_optimizer.optimize(res, 'a', 'b')
+        self.assertEqual([['a', 'b', 6]], res)
+
+    def test_optimize_zero_start_end_edge(self):
+        res = [['a', 'b', 0], ['a', 'c', 2], ['c', 'b', 2]]
+        cable_optimizer.optimize(res, 'a', 'b')
+        self.assertEqual([['a', 'b', 0]], res)
+
+    def test_optimize_until_both_passes_idle(self):
+        # zero d-e cable turns d-f-e into a cycle on e, e is transitional
+        # only after it is removed and parallel pass has nothing to do,
+        # optimize must not stop there
+        res = [['e', 'f', 1], ['f', 'd', 4], ['d', 'e', 0],
+               ['b', 'e', 2], ['d', 'a', 4]]
+        cable_optimizer.optimize(res, 'a', 'b')
+        self.assertEqual([['a', 'b', 6]], res)
+
+    def test_remove_cycled_edges(self):
+        edges = [['a', 'a', 1], ['a', 'b', 2], ['c', 'c', 0], ['b', 'c', 3]]
+        self.assertEqual(2, cable_optimizer.remove_cycled_edges(edges))
+        self.assertEqual([['a', 'b', 2], ['b', 'c', 3]], edges)
+
+    def test_prune_irrelevant_edges(self):
+        edges = [['a', 'c', 1], ['c', 'b', 1], ['a', 'b', 3],
+                 ['c', 'x', 1], ['x', 'y', 1],              # dangling tree
+                 ['b', 'p', 1], ['p', 'q', 1], ['q', 'b', 1],  # cycle on b
+                 ['c', 'c', 4]]                             # cycled edge
+        removed = cable_optimizer.prune_irrelevant_edges(edges, 'a', 'b')
+        self.assertEqual(6, removed)
+        self.assertEqual([['a', 'c', 1], ['c', 'b', 1], ['a', 'b', 3]],
+                         edges)
+
+    def test_prune_keeps_bridge_on_path(self):
+        edges = [['a', 'c', 1], ['a', 'c', 2], ['c', 'd', 5],
+                 ['d', 'b', 1], ['d', 'b', 2]]
+        self.assertEqual(0, cable_optimizer.prune_irrelevant_edges(
+            edges, 'a', 'b'))
+
+    def test_prune_not_connected(self):
+        edges = [['a', 'c', 1], ['d', 'b', 1]]
+        self.assertEqual(0, cable_optimizer.prune_irrelevant_edges(
+            edges, 'a', 'b'))
+        self.assertEqual(2, len(edges))
+
+    def test_optimize_shorted_part(self):
+        # bridge between c and x is on a-b paths until zero cable merges
+        # x into c, then it hangs on c and is reduced away
+        res = [['a', 'c', 1], ['c', 'b', 1], ['c', 'x', 0], ['x', 'b', 1],
+               ['c', 'p', 1], ['c', 'q', 2], ['p', 'q', 3],
+               ['p', 'x', 4], ['q', 'x', 5]]
+        profiler = cable_optimizer.Profiler()
+        cable_optimizer.optimize(res, 'a', 'b', profiler)
+        self.assertEqual([['a', 'b', 1.5]], res)
+
+    def test_optimize_dangling_block(self):
+        # K4 hanging on c is not reduced, it keeps c off degree 2 until
+        # it is pruned, then a-c-b is reduced as well
+        res = [['a', 'c', 1], ['c', 'b', 2],
+               ['c', 'p', 1], ['c', 'q', 2], ['c', 'r', 3],
+               ['p', 'q', 4], ['p', 'r', 5], ['q', 'r', 6]]
+        profiler = cable_optimizer.Profiler()
+        cable_optimizer.optimize(res, 'a', 'b', profiler)
+        self.assertEqual([['a', 'b', 3]], res)
+        self.assertEqual(6, profiler.phases['prune_irrelevant_edges'][2])
+
+    def test_optimize_profiler(self):
+        profiler = cable_optimizer.Profiler()
+        cable_optimizer.optimize(self.e1, 'a', 'b', profiler)
+        self.assertEqual([['a', 'b', 2]], self.e1)
+
+        # 6 edges are reduced to 1 in total
+        self.assertEqual(5, sum(p[2] for p in profiler.phases.values()))
+        self.assertEqual(2, profiler.phases['eliminate_zero_edges'][2])
+
+    def test_optimize_fraction_delays(self):
+        delays = cable_optimizer.DELAYS["fraction"]
+        res = [['a', 'b', delays.delay(3)] for _ in range(3)]
+        res.append(['a', 'b', delays.delay(7)])
+        cable_optimizer.optimize(res, 'a', 'b', delays=delays)
+        self.assertEqual([['a', 'b', cable_optimizer.Fraction(7, 8)]], res)
+        self.assertEqual("7/8", delays.format(res[0][2]))
+
+    def test_optimize_fixed_delays(self):
+        delays = cable_optimizer.DELAYS["fixed"]
+        res = [['a', 'c', delays.delay(8)], ['c', 'b', delays.delay(8)],
+               ['a', 'b', delays.delay(16)], ['a', 'b', delays.delay(4)]]
+        cable_optimizer.optimize(res, 'a', 'b', delays=delays)
+        self.assertEqual([['a', 'b', 2666667]], res)
+        self.assertEqual("2.666667", delays.format(res[0][2]))
+        self.assertEqual("4", delays.format(delays.delay(4)))
+
+    def test_float_delays_format(self):
+        delays = cable_optimizer.DELAYS["float"]
+        self.assertEqual("2", delays.format(2.0))
+        self.assertEqual("2.5", delays.format(2.5))
+
+
+class IncrementalOptimizerTest(unittest.TestCase):
+    """ unit test for incremental updates of reduced graph """
+
+    def setUp(self):
+        self.e1 = [["a", "e", 2],
+                   ["e", "b", 2],
+                   ["a", "c", 0],
+                   ["c", "d", 8],
+                   ["c", "d", 8],
+                   ["d", "b", 0]]
+        self.opt = cable_optimizer.IncrementalOptimizer(self.e1, 'a', 'b')
+
+    def test_initial_result(self):
+        self.assertEqual([['a', 'b', 2]], self.opt.result())
+
+    def test_change_delay(self):
+        self.opt.change_delay(3, 4)  # c d 8 -> c d 4: a-c-d-b gives 8/3
+        exp = 4 * (8 / 3) / (4 + 8 / 3)
+        self.assertEqual(1, len(self.opt.result()))
+        self.assertAlmostEqual(exp, self.opt.result()[0][2])
+
+    def test_remove_and_add_edge(self):
+        self.opt.remove_edge(0)  # a e 2, path through e is broken
+        # dangling b-e cable is pruned
+        self.assertEqual([['a', 'b', 4]],
+                         [e[:2] + [int(e[2])] for e in self.opt.result()])
+
+        self.opt.add_edge('e', 'a', 2)  # restore it
+        self.assertEqual([['a', 'b', 2]],
+                         [e[:2] + [int(e[2])] for e in self.opt.result()])
+
+    def test_zero_delay_change(self):
+        self.opt.change_delay(2, 4)  # a c 0 -> a c 4: a-c-d-b gives 8
+        self.assertAlmostEqual(4 * 8 / 12, self.opt.result()[0][2])
+
+        self.opt.change_delay(2, 0)
+        self.assertAlmostEqual(2, self.opt.result()[0][2])
+
+    def test_change_delay_recomputes_path(self):
+        # series-parallel network is reduced without optimize at all
+        optimize = cable_optimizer.optimize
+
+        def fail(*args, **kwargs):
+            raise AssertionError("optimize called")
+
+        cable_optimizer.optimize = fail
+        try:
+            self.opt.change_delay(4, 4)  # c d 8 -> c d 4
+            self.opt.remove_edge(3)  # c d 8, a-c-d-b is 4 now
+        finally:
+            cable_optimizer.optimize = optimize
+        self.assertAlmostEqual(2, self.opt.result()[0][2])
+
+    def test_bridge_block(self):
+        bridge = [['a', 'c', 1], ['a', 'd', 2], ['c', 'd', 3],
+                  ['c', 'b', 4], ['d', 'b', 5], ['a', 'b', 6]]
+        opt = cable_optimizer.IncrementalOptimizer(bridge, 'a', 'b')
+        opt.change_delay(2, 6)
+        bridge[2][2] = 6
+        expected = [e[:] for e in bridge]
+        cable_optimizer.optimize(expected, 'a', 'b')
+        self.assertEqual(sorted(expected), sorted(opt.result()))
+
+        opt.remove_edge(2)  # no bridge, series-parallel again
+        self.assertEqual(1, len(opt.result()))
+        self.assertAlmostEqual(1 / (1 / 5.0 + 1 / 7.0 + 1 / 6.0),
+                               opt.result()[0][2])
+
+    def test_dangling_part_attached(self):
+        self.opt.add_edge('b', 'x', 1)
+        self.opt.add_edge('x', 'y', 1)
+        self.assertEqual([['a', 'b', 2]], self.opt.result())
+
+        self.opt.add_edge('y', 'a', 2)  # a-y-x-b path of 4
+        self.assertEqual([['a', 'b', 4.0 / 3]], self.opt.result())
+
+    def test_disconnected(self):
+        opt = cable_optimizer.IncrementalOptimizer(
+            [['a', 'c', 1], ['c', 'b', 2]], 'a', 'b')
+        opt.remove_edge(1)
+        self.assertEqual([['a', 'c', 1]], opt.result())
+
+        opt.add_edge('b', 'c', 3)
+        self.assertEqual([['a', 'b', 4]], opt.result())
+
+
+
+class MemoizedReducerTest(unittest.TestCase):
+    """ unit test for series-parallel decomposition with cache """
+
+    def setUp(self):
+        self.delays = cable_optimizer.DELAYS["fraction"]
+
+    def rack(self, prefix, a, b):
+        """ same sub-network with different vertexes names """
+        return [[a, prefix + "1", 2], [prefix + "1", b, 2],
+                [a, prefix + "2", 4], [prefix + "2", prefix + "3", 4],
+                [prefix + "2", prefix + "3", 4], [prefix + "3", b, 2]]
+
+    def test_reduce(self):
+        e1 = [["a", "e", 2], ["e", "b", 2], ["a", "c", 0],
+              ["c", "d", 8], ["c", "d", 8], ["d", "b", 0]]
+        reducer = cable_optimizer.MemoizedReducer(delays=self.delays)
+        self.assertEqual(5, reducer.reduce(e1, 'a', 'b'))
+        self.assertEqual([['a', 'b', 2]], e1)
+
+    def test_repeated_racks(self):
+        edges = (self.rack("x", "a", "m") + self.rack("y", "a", "m") +
+                 self.rack("z", "m", "b"))
+        reducer = cable_optimizer.MemoizedReducer(delays=self.delays)
+        reducer.reduce(edges, 'a', 'b')
+
+        # rack is 4 || 8 = 8/3, two of them in parallel, then in series
+        exp = cable_optimizer.Fraction(8, 3) / 2 + cable_optimizer.Fraction(
+            8, 3)
+        self.assertEqual([['a', 'b', exp]], edges)
+        self.assertTrue(reducer.cache.hits > 0)
+
+    def test_dangling_parts_dropped(self):
+        edges = [['a', 'b', 3], ['b', 'x', 1], ['x', 'y', 1], ['y', 'b', 1]]
+        cable_optimizer.MemoizedReducer().reduce(edges, 'a', 'b')
+        self.assertEqual([['a', 'b', 3]], edges)
+
+    def test_bridge_block(self):
+        # Wheatstone bridge is not series-parallel, optimize keeps it
+        bridge = [['a', 'c', 1], ['a', 'd', 2], ['c', 'd', 3],
+                  ['c', 'b', 4], ['d', 'b', 5]]
+        expected = [e[:] for e in bridge]
+        cable_optimizer.optimize(expected, 'a', 'b')
+
+        edges = [e[:] for e in bridge]
+        reducer = cable_optimizer.MemoizedReducer()
+        reducer.reduce(edges, 'a', 'b')
+        self.assertEqual(sorted(expected), sorted(edges))
+
+        edges = [e[:] for e in bridge]
+        reducer.reduce(edges, 'a', 'b')
+        self.assertEqual(sorted(expected), sorted(edges))
+        self.assertTrue(reducer.cache.hits > 0)
+
+    def test_bridge_in_series(self):
+        # x-y and y-b segments are next to bridge block, still a chain
+        edges = [['a', 'c', 1], ['a', 'd', 2], ['c', 'd', 3],
+                 ['c', 'x', 4], ['d', 'x', 5], ['x', 'y', 1], ['y', 'b', 2]]
+        expected = [e[:] for e in edges]
+        cable_optimizer.optimize(expected, 'a', 'b')
+
+        cable_optimizer.MemoizedReducer().reduce(edges, 'a', 'b')
+        self.assertEqual(sorted(expected), sorted(edges))
+        self.assertIn(['b', 'x', 3], edges)
+
+    def test_disk_cache(self):
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, "cache")
+        try:
+            cache = cable_optimizer.ReductionCache(path=path)
+            edges = self.rack("x", "a", "b")
+            cable_optimizer.MemoizedReducer(cache).reduce(edges, 'a', 'b')
+            cache.close()
+
+            cache = cable_optimizer.ReductionCache(path=path)
+            edges = self.rack("y", "a", "b")
+            cable_optimizer.MemoizedReducer(cache).reduce(edges, 'a', 'b')
+            cache.close()
+        finally:
+            shutil.rmtree(folder)
+
+        # only the whole network is new, all its parts are on disk
+        self.assertEqual(1, cache.misses)
+        self.assertEqual(1, len(edges))
+
+    def test_same_network_skips_walk(self):
+        edges = self.rack("x", "a", "b") + [['a', 'b', 3], ['b', 'q', 1]]
+        for e in edges:
+            e[2] = self.delays.delay(e[2])
+        reducer = cable_optimizer.MemoizedReducer(delays=self.delays)
+        reducer.reduce([e[:] for e in edges], 'a', 'b')
+
+        split_parts = cable_optimizer.split_parts
+
+        def fail(*args, **kwargs):
+            raise AssertionError("split_parts called")
+
+        cable_optimizer.split_parts = fail
+        try:
+            reduced = [e[:] for e in edges]
+            self.assertEqual(7, reducer.reduce(reduced, 'a', 'b'))
+        finally:
+            cable_optimizer.split_parts = split_parts
+        # 8/3 || 3 = 24/17
+        self.assertEqual([['a', 'b', cable_optimizer.Fraction(24, 17)]],
+                         reduced)
+
+    def test_disk_cache_delays(self):
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, "cache")
+        results = []
+        try:
+            # fixed point 2 is 2000000, as float 2000000 it has the same
+            # leaf key, but 2000000 / 3 is rounded only by fixed point
+            for name, delay in (("fixed", 2), ("float", 2000000)):
+                delays = cable_optimizer.DELAYS[name]
+                edges = [['a', 'b', delays.delay(delay)] for _ in range(3)]
+                cache = cable_optimizer.ReductionCache(path=path)
+                cable_optimizer.MemoizedReducer(cache, delays).reduce(
+                    edges, 'a', 'b')
+                cache.close()
+                results.append(edges[0][2])
+        finally:
+            shutil.rmtree(folder)
+
+        self.assertEqual(666667, results[0])
+        self.assertAlmostEqual(2000000 / 3.0, results[1])
+        self.assertEqual(0, cache.hits)
+
+    def test_lru(self):
+        cache = cable_optimizer.ReductionCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertEqual(["a", "c"], list(cache.records))
+
 
 if __name__ == "__main__":
     unittest.main()
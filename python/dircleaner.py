@@ -3,6 +3,8 @@ Utility script to clean old files in directory.
 
 Scans the directory, finds files that are older than specified number of days
 (by default, 30) and removes them. Adds record about that to log.
+With --quota also removes least recently accessed files until the total
+size of files is under the quota.
 
 Intended to be used with python 3
 
@@ -16,9 +18,23 @@ Edited on 2012-04-03
 import os
 import time
 from datetime import timedelta
-import shutil
 import argparse
+import configparser
+import gzip
+import heapq
 import logging
+import logging.handlers
+import queue
+import re
+import sqlite3
+import threading
+from collections import deque
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+# marks records logged for every file, dropped in summary mode
+PER_FILE = {"per_file": True}
 
 
 def calculate_days_ago_in_sec(base_time_sec, days=30):
@@ -27,48 +43,1122 @@ def calculate_days_ago_in_sec(base_time_sec, days=30):
     return month_ago_in_sec
 
 
-def scantree_remove_empty_folders(path):
-    """ Scan file tree and remove empty folders """
-    for dirpath, dirnames, filenames in os.walk(path):
-        if len(filenames) == 0 and len(dirnames) == 0:
-            logger.info("Empty Folder found and removed: %s", dirpath)
-            shutil.rmtree(dirpath)
+def translate_glob(pattern):
+    """
+    Translate glob to regular expression matching whole relative path
+
+    Like fnmatch.translate, but "*", "?" and "[...]" never match "/",
+    so every wildcard stays within one path component.
+    """
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            parts.append("[^/]*")
+        elif c == "?":
+            parts.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and pattern[j] == "!":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                parts.append("\\[")  # no closing bracket, literal "["
+                continue
+            chars = pattern[i:j].replace("\\", "\\\\")
+            i = j + 1
+            if chars.startswith("!"):
+                chars = "^" + chars[1:]
+            elif chars.startswith("^"):
+                chars = "\\" + chars
+            parts.append("(?!/)[%s]" % chars)
+        else:
+            parts.append(re.escape(c))
+    return "(?s:%s)\\Z" % "".join(parts)
+
+
+def compile_patterns(patterns):
+    """
+    Compile glob and regex patterns into single regular expression
+
+    Glob without "/" matches name of file or folder, glob with "/"
+    matches whole path relative to root, wildcards of glob never match
+    "/" (see translate_glob). Pattern starting with "re:" is
+    regular expression searched in relative path. Paths use "/" as
+    separator on every platform.
+
+    Returns:
+        - compiled regular expression, None for no patterns
+    """
+    parts = []
+    for pattern in patterns:
+        if pattern.startswith("re:"):
+            parts.append(".*?(?:%s)" % pattern[3:])
+        elif "/" in pattern:
+            parts.append(translate_glob(pattern.strip("/")))
+        else:
+            parts.append("(?:.*/)?" + translate_glob(pattern))
+    if not parts:
+        return None
+    return re.compile("|".join("(?:%s)" % part for part in parts))
+
+
+class Rules(object):
+    """
+    Include and exclude rules of cleaned files
+
+    Excluded folders are not scanned at all, excluded files are kept
+    without stat. If include patterns are given only files matching them
+    could be removed. Patterns are described in compile_patterns.
+
+    Arguments:
+        - exclude: patterns of protected files and folders
+        - include: patterns of files that could be removed, all if empty
+    """
+
+    def __init__(self, exclude=(), include=()):
+        self.exclude_patterns = list(exclude)
+        self.include_patterns = list(include)
+        self.exclude = compile_patterns(exclude)
+        self.include = compile_patterns(include)
+        # FolderIndex is reset when rules change
+        self.signature = repr((sorted(exclude), sorted(include)))
+
+    def prunes(self, relpath):
+        """ Check if folder @relpath should not be scanned """
+        return self.exclude is not None and bool(
+            self.exclude.match(relpath))
+
+    def allows(self, relpath):
+        """ Check if file @relpath could be removed """
+        if self.include is not None and not self.include.match(relpath):
+            return False
+        return not self.prunes(relpath)
+
+
+def relative_path(root_prefix, path):
+    """ Path relative to root with "/" separators, see compile_patterns """
+    relpath = path[root_prefix:]
+    if os.sep != "/":
+        relpath = relpath.replace(os.sep, "/")
+    return relpath
+
+
+class RateLimiter(object):
+    """
+    Token bucket limiting file operations per second, thread safe
+
+    Every operation takes a token, tokens come at @rate per second and up
+    to @burst of them are saved. With @backoff the rate is halved (down to
+    1% of @rate) while moving average of operation latency is over
+    @latency_factor times the base latency, and restored gradually when
+    latency is back. Base latency is the lowest average seen, it grows by
+    @base_decay per second towards the current one, so latency that stays
+    higher for long (e.g. share moved to a slower server) becomes the
+    new base instead of holding the rate down forever. Latency under
+    @min_latency never backs off.
+
+    Arguments:
+        - rate: max operations per second, None for no limit
+        - burst: max amount of operations at once, default is 1/10 of rate
+        - backoff: adapt rate to observed latency
+        - latency_factor: latency growth that makes rate to back off
+        - min_latency: latency in seconds considered fine anyway
+        - base_decay: share base latency grows per second
+    """
+
+    def __init__(self, rate=None, burst=None, backoff=False,
+                 latency_factor=2.0, min_latency=0.001, base_decay=0.05):
+        if rate is not None and rate <= 0:
+            raise ValueError("Rate should be positive, got %r" % (rate,))
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst if burst else max(rate / 10.0, 1.0) if rate else 0
+        self.backoff = backoff and rate is not None
+        self.latency_factor = latency_factor
+        self.min_latency = min_latency
+        self.base_decay = base_decay
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.latency = None  # moving average
+        self.base_latency = None
+        self.adjusted = self.updated
+
+    def acquire(self):
+        """ Take token, sleeps until it is there """
+        if self.rate is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1  # reserved, could go below zero
+            wait = -self.tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def observe(self, latency):
+        """ Account latency of operation, adapt rate once per second """
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += 0.2 * (latency - self.latency)
+            if self.base_latency is None or self.latency < self.base_latency:
+                self.base_latency = self.latency
+
+            now = time.monotonic()
+            if now - self.adjusted < 1.0:
+                return
+            self.adjusted = now
+            if (self.latency > self.min_latency and self.latency >
+                    self.base_latency * self.latency_factor):
+                self.rate = max(self.rate / 2.0, self.max_rate / 100.0)
+                logger.info("Latency %.1f ms, rate lowered to %.1f/s",
+                            self.latency * 1000, self.rate)
+            else:
+                self.rate = min(self.rate + self.max_rate / 10.0,
+                                self.max_rate)
+            self.base_latency = min(self.latency,
+                                    self.base_latency * (1 + self.base_decay))
+
+    def call(self, func, *args, **kwargs):
+        """ Call @func when token is there, observe its latency """
+        self.acquire()
+        if not self.backoff:
+            return func(*args, **kwargs)
+        started = time.monotonic()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.observe(time.monotonic() - started)
+
+
+# limits of stat calls (and folder listings) and removals, set by main
+stat_limiter = RateLimiter()
+delete_limiter = RateLimiter()
+# limiters of the root cleaned by current thread, set by run_roots
+_root_limiters = threading.local()
+
+
+def use_root_limiters(limiters):
+    """ Limit calls of current thread by (stat, delete) limiters of root """
+    _root_limiters.stat, _root_limiters.delete = limiters or (None, None)
+
+
+def root_stat_limiter():
+    """ Stat limiter of the root cleaned by current thread """
+    return getattr(_root_limiters, "stat", None) or stat_limiter
+
+
+def root_delete_limiter():
+    """ Delete limiter of the root cleaned by current thread """
+    return getattr(_root_limiters, "delete", None) or delete_limiter
+
+
+class Folder(object):
+    """
+    Folder in the tree being cleaned
+
+    Counts children (old files and subfolders) that are not resolved yet,
+    plus one for its own scan. When the count drops to zero the folder is
+    resolved: removed if nothing is left in it, otherwise its parent learns
+    it is not empty. So folders emptied by the cleaning are pruned bottom-up
+    in the same pass that removes the files.
+    """
+
+    def __init__(self, path, parent=None, index=None):
+        self.path = path
+        self.parent = parent
+        self.pending = 1  # own scan
+        self.kept = False  # something stays in the folder
+
+        # state recorded in FolderIndex
+        self.index = index
+        self.mtime = None  # st_mtime_ns before scan, None if not scanned
+        self.files = 0  # amount of files kept
+        self.oldest_atime = None  # of files kept
+        self.changed = False  # something was removed from the folder
+        self.listed = False  # listed by scan, not taken from the index
+
+    def keep_file(self, atime=None):
+        """
+        Account file (or excluded folder) that stays in the folder
+
+        Deleter threads update the folder as well, so it should be called
+        under lock of the remover.
+        """
+        self.kept = True
+        self.files += 1
+        if atime is None:
+            return  # never removed
+        if self.oldest_atime is None or atime < self.oldest_atime:
+            self.oldest_atime = atime
+
+
+def resolve_folder(folder, kept=False, lock=nullcontext()):
+    """
+    Account one resolved child of @folder
+
+    Removes folders left empty up the tree, root folder (without parent)
+    is never removed.
+
+    Arguments:
+        - folder: Folder whose child is resolved
+        - kept: True if the child stays in the folder
+        - lock: guards folders counters when resolved from several threads
+    """
+    while folder is not None:
+        with lock:
+            folder.kept = folder.kept or kept
+            folder.pending -= 1
+            if folder.pending > 0:
+                return
+            kept = folder.kept
+
+        # only one thread gets here for each folder
+        if not kept and folder.parent is not None:
+            kept = not remove_folder(folder.path)
+            folder.parent.changed = folder.parent.changed or not kept
+        if folder.index is not None:
+            folder.index.resolved(folder, kept)
+        folder = folder.parent
+
+
+def remove_file(path):
+    """ Remove file, returns True on success """
+    logger.info("File to removal found: %s", path, extra=PER_FILE)
+    try:
+        root_delete_limiter().call(os.remove, path)
+    except OSError:
+        logger.info("Failed to remove file: %s, file skipped.", path)
+        return False
+    return True
+
+
+def remove_folder(path):
+    """ Remove empty folder, returns True on success """
+    try:
+        # fails if something appeared in it meanwhile
+        root_delete_limiter().call(os.rmdir, path)
+    except OSError:
+        logger.info("Failed to remove folder: %s, folder skipped.", path)
+        return False
+    logger.info("Empty Folder found and removed: %s", path, extra=PER_FILE)
+    return True
+
+
+def file_atime(entry):
+    """ Access time of file of os.DirEntry, None if it is gone """
+    try:
+        return root_stat_limiter().call(entry.stat,
+                                        follow_symlinks=False).st_atime
+    except OSError:
+        return None
+
+
+class FolderIndex(object):
+    """
+    Index of folders kept between runs in sqlite database
+
+    For every folder stores its mtime, amount and oldest access time of
+    files left in it, and its parent. Folder with the same mtime has the
+    same files and subfolders as on last run, and access time of a file
+    only grows, so if the oldest one is still fresh the folder is not
+    listed at all: its subfolders are taken from the index.
+    Subfolders are still checked one by one, so only listings and stat of
+    files are saved, changes deep in the tree are never missed.
+
+    Index file should be kept locally, not on the share being cleaned.
+    Updates come from deleter threads too, they are collected and written
+    in one transaction by save(). Index made with different Rules is
+    cleared, as excluded folders are not in it.
+
+    Arguments:
+        - path: path of sqlite database file
+        - signature: Rules.signature of the run
+    """
+
+    def __init__(self, path, signature=""):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS folders ("
+                        "path TEXT PRIMARY KEY, parent TEXT, "
+                        "mtime INTEGER, files INTEGER, oldest_atime REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS folders_parent "
+                        "ON folders (parent)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS rules (signature TEXT)")
+        row = self.db.execute("SELECT signature FROM rules").fetchone()
+        if row is None or row[0] != signature:
+            with self.db:
+                self.db.execute("DELETE FROM folders")
+                self.db.execute("DELETE FROM rules")
+                self.db.execute("INSERT INTO rules VALUES (?)", (signature,))
+        self.lock = threading.Lock()
+        self.updates = []
+        self.removed = []  # removed folders and listed ones, their
+        # subfolders are forgotten and listed ones added again
+        self.reused = 0
+
+    def reuse(self, folder, rm_time):
+        """
+        Resolve contents of unchanged @folder from the index
+
+        Arguments:
+            - folder: Folder to be scanned, gets its mtime
+            - rm_time: files accessed before are going to be removed
+
+        Returns:
+            - list of subfolders paths, None if folder should be scanned
+        """
+        try:
+            folder.mtime = root_stat_limiter().call(
+                os.stat, folder.path).st_mtime_ns
+        except OSError:
+            return None
+
+        row = self.db.execute("SELECT mtime, files, oldest_atime "
+                              "FROM folders WHERE path = ?",
+                              (folder.path,)).fetchone()
+        if row is None or row[0] != folder.mtime:
+            return None
+        if rm_time is not None and row[2] is not None and row[2] < rm_time:
+            return None  # some file could be expired already
+
+        folder.files = row[1]
+        folder.oldest_atime = row[2]
+        folder.kept = folder.files > 0
+        self.reused += 1
+        return [r[0] for r in self.db.execute(
+            "SELECT path FROM folders WHERE parent = ?", (folder.path,))]
+
+    def resolved(self, folder, kept):
+        """ Remember state of resolved @folder, forget removed one """
+        if not kept or folder.listed:
+            with self.lock:
+                self.removed.append((folder.path,))
+        if not kept:
+            return
+
+        mtime = folder.mtime
+        if folder.changed and mtime is not None:
+            try:
+                mtime = root_stat_limiter().call(
+                    os.stat, folder.path).st_mtime_ns
+            except OSError:
+                mtime = None
+        parent = folder.parent.path if folder.parent is not None else None
+        with self.lock:
+            self.updates.append((folder.path, parent, mtime,
+                                 folder.files, folder.oldest_atime))
+
+    def save(self):
+        """ Write collected updates to database """
+        with self.lock:
+            updates, self.updates = self.updates, []
+            removed, self.removed = self.removed, []
+        with self.db:
+            self.db.executemany("DELETE FROM folders "
+                                "WHERE path = ?1 OR parent = ?1", removed)
+            self.db.executemany("INSERT OR REPLACE INTO folders "
+                                "VALUES (?, ?, ?, ?, ?)", updates)
+
+    def close(self):
+        self.save()
+        self.db.close()
+
+
+class FileRemover(object):
+    """
+    Removes files one by one in the scanning thread
+
+    Resolves folder of every removed file, so emptied folders are pruned
+    right after their last file. Counts removed files and bytes freed.
+    """
+
+    def __init__(self):
+        self.lock = nullcontext()
+        self.removed = 0
+        self.failed = 0
+        self.freed = 0  # size of removed files, if given to submit
+        self.started = time.time()
+
+    def submit(self, path, folder, size=0):
+        """ Remove file @path of @size bytes from @folder """
+        self.done(folder, remove_file(path), size)
+
+    def done(self, folder, removed, size=0):
+        """ Account removal result and resolve file in its @folder """
+        with self.lock:
+            if removed:
+                self.removed += 1
+                self.freed += size
+                folder.changed = True
+            else:
+                self.failed += 1
+                folder.mtime = None  # retry the file on next run
+        resolve_folder(folder, not removed, self.lock)
+
+    def flush(self):
+        """ Wait for submitted files to be processed, remover stays open """
+        pass
+
+    def close(self):
+        """ Wait for all submitted files to be processed """
+        pass
+
+    def rate(self):
+        """ Files removed per second since start """
+        elapsed = time.time() - self.started
+        return self.removed / elapsed if elapsed > 0 else 0.0
+
+
+class DeletePipeline(FileRemover):
+    """
+    Removes files in a pool of threads fed by the scanner
+
+    Each removal on a network share is a round-trip, so several of them
+    are kept in flight. Bounded queue holds the scanner back when deleters
+    fall behind. Folders are still pruned after all their files, as
+    counters of Folder are resolved under the lock.
+
+    Arguments:
+        - workers: amount of deleter threads
+        - queue_size: max amount of files waiting for removal
+    """
+
+    def __init__(self, workers=8, queue_size=1000):
+        FileRemover.__init__(self)
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue(maxsize=queue_size)
+        self.threads = [threading.Thread(target=self._work)
+                        for _ in range(workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, path, folder, size=0):
+        self.jobs.put((path, folder, size))  # blocks while queue is full
+
+    def flush(self):
+        self.jobs.join()
+
+    def close(self):
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                return
+
+            path, folder, size = job
+            try:
+                removed = remove_file(path)
+            except Exception:
+                logger.exception("Failed to remove file: %s", path)
+                removed = False
+            self.done(folder, removed, size)
+            self.jobs.task_done()
+
+
+class DeleteScheduler(object):
+    """
+    Pool of deleter threads shared by several cleaned roots
+
+    Every root submits files to its own DeleteLane. Threads take files
+    from the lanes round-robin and skip lanes having @limit removals in
+    flight already, so a slow share holds at most its limit of threads
+    and the rest keep removing files of other shares.
+
+    Arguments:
+        - workers: amount of deleter threads
+    """
+
+    def __init__(self, workers=8):
+        self.condition = threading.Condition()
+        self.lanes = []
+        self.next = 0  # lane to look at first
+        self.closed = False
+        self.threads = [threading.Thread(target=self._work)
+                        for _ in range(workers)]
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
+
+    def lane(self, limit=4, queue_size=1000, limiters=None):
+        """ Add lane of one root, see DeleteLane """
+        lane = DeleteLane(self, limit, queue_size, limiters)
+        with self.condition:
+            self.lanes.append(lane)
+        return lane
+
+    def close(self):
+        """ Wait for all submitted files and stop threads """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def _take(self):
+        """ Take next file round-robin, None when closed and all done """
+        with self.condition:
+            while True:
+                lanes = self.lanes[self.next:] + self.lanes[:self.next]
+                for i, lane in enumerate(lanes):
+                    if lane.jobs and lane.in_flight < lane.limit:
+                        lane.in_flight += 1
+                        self.next = (self.next + i + 1) % len(self.lanes)
+                        self.condition.notify_all()  # lane has space
+                        return lane, lane.jobs.popleft()
+                if self.closed and not any(lane.jobs for lane in lanes):
+                    return None
+                self.condition.wait()
+
+    def _work(self):
+        while True:
+            taken = self._take()
+            if taken is None:
+                return
+
+            lane, (path, folder, size) = taken
+            use_root_limiters(lane.limiters)
+            try:
+                removed = remove_file(path)
+            except Exception:
+                logger.exception("Failed to remove file: %s", path)
+                removed = False
+            lane.done(folder, removed, size)
+            with self.condition:
+                lane.in_flight -= 1
+                self.condition.notify_all()
+
 
-        # pass folders to be scanned by same function (recursive)
-        for dirname in dirnames:
-            scantree_remove_empty_folders(os.path.join(dirpath, dirname))
+class DeleteLane(FileRemover):
+    """
+    Files of one root waiting for DeleteScheduler threads
+
+    Arguments:
+        - scheduler: DeleteScheduler removing the files
+        - limit: max amount of files of the root removed at once
+        - queue_size: max amount of files waiting for removal
+        - limiters: optional (stat, delete) RateLimiter of the root,
+            module ones are used for None
+    """
+
+    def __init__(self, scheduler, limit=4, queue_size=1000, limiters=None):
+        FileRemover.__init__(self)
+        self.lock = threading.Lock()
+        self.scheduler = scheduler
+        self.limit = max(limit, 1)
+        self.queue_size = queue_size
+        self.limiters = limiters
+        self.jobs = deque()
+        self.in_flight = 0
+
+    def submit(self, path, folder, size=0):
+        condition = self.scheduler.condition
+        with condition:
+            while len(self.jobs) >= self.queue_size:
+                condition.wait()
+            self.jobs.append((path, folder, size))
+            condition.notify_all()
+
+    def flush(self):
+        condition = self.scheduler.condition
+        with condition:
+            while self.jobs or self.in_flight:
+                condition.wait()
+
+    def close(self):
+        self.flush()  # threads are shared, stopped by scheduler
+
+
+def scantree_clean(path, rm_time, remover=None, index=None, rules=None):
+    """
+    Remove files older than rm_time and folders left empty
+
+    Single os.scandir pass over the tree, every folder is listed once.
+
+    Arguments:
+        - path: root folder, it is never removed
+        - rm_time: files accessed before are removed, None to keep files
+        - remover: FileRemover (default) or DeletePipeline,
+            pipeline should be closed by caller to wait for removals
+        - index: optional FolderIndex to skip listing of unchanged folders,
+            should be saved by caller after remover is closed
+        - rules: optional Rules, excluded folders are kept as they are
+
+    Returns:
+        - remover
+    """
+    if remover is None:
+        remover = FileRemover()
+    lock = remover.lock
+    prefix = len(os.path.join(path, ""))
+
+    folders = [Folder(path, index=index)]
+    while folders:
+        folder = folders.pop()
+
+        subfolders = index.reuse(folder, rm_time) if index else None
+        if subfolders is not None:
+            for subfolder in subfolders:
+                with lock:
+                    folder.pending += 1
+                folders.append(Folder(subfolder, folder, index))
+            resolve_folder(folder, lock=lock)  # scan is done
+            continue
+
+        folder.listed = True
+        try:
+            with root_stat_limiter().call(os.scandir, folder.path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if rules and rules.prunes(
+                                relative_path(prefix, entry.path)):
+                            with lock:
+                                folder.keep_file()
+                            continue
+                        with lock:
+                            folder.pending += 1
+                        folders.append(Folder(entry.path, folder, index))
+                    elif rules and not rules.allows(
+                            relative_path(prefix, entry.path)):
+                        with lock:
+                            folder.keep_file()  # no need to stat the file
+                    elif rm_time is None and index is None:
+                        with lock:
+                            folder.kept = True  # no need to stat the file
+                    else:
+                        atime = file_atime(entry)
+                        if atime is None:
+                            continue  # removed meanwhile
+                        if rm_time is not None and atime < rm_time:
+                            with lock:
+                                folder.pending += 1
+                            remover.submit(entry.path, folder)
+                        else:
+                            with lock:
+                                folder.keep_file(atime)
+        except OSError:
+            logger.info("Failed to scan folder: %s, folder skipped.",
+                        folder.path)
+            with lock:
+                folder.kept = True
+                folder.mtime = None  # scan it next time again
+        resolve_folder(folder, lock=lock)  # scan is done
+
+    return remover
+
+
+def scantree_remove_empty_folders(path, rules=None):
+    """ Scan file tree and remove empty folders (also emptied ones) """
+    scantree_clean(path, None, rules=rules)
+
+
+def scantree_gen_file_entries(path, rules=None):
+    """
+    Scan file tree in a single pass and yield os.DirEntry of every file
+
+    Folders are listed with os.scandir, so file type comes with the listing
+    and entry.stat() is made at most once per file (on Windows it is taken
+    from the listing as well, without a round-trip per file).
+    Symlinks are not followed. Folders that can't be listed are skipped.
+    With @rules only files allowed by them are yielded, excluded folders
+    are not listed.
+    """
+    prefix = len(os.path.join(path, ""))
+    folders = [path]
+    while folders:
+        dirpath = folders.pop()
+        try:
+            with root_stat_limiter().call(os.scandir, dirpath) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not rules or not rules.prunes(
+                                relative_path(prefix, entry.path)):
+                            folders.append(entry.path)
+                    elif not rules or rules.allows(
+                            relative_path(prefix, entry.path)):
+                        yield entry
+        except OSError:
+            logger.info("Failed to scan folder: %s, folder skipped.", dirpath)
 
 
 def scantree_gen_files_to_removal(path, rm_time):
-    """ Scan file tree and return files older than rm_time """
-    for dirpath, dirnames, filenames in os.walk(path):
-
-        # check the file dates in root folder
-        for filename in filenames:
-            fullPathToFile = os.path.join(dirpath, filename)
-            filestat = os.stat(os.path.join(dirpath, filename))
-            recent_access_time = filestat.st_atime
-            if recent_access_time < rm_time:
-                yield fullPathToFile
-
-        # pass referenced folders to be scanned by same function (recursive)
-        for dirname in dirnames:
-            scantree_gen_files_to_removal(os.path.join(dirpath, dirname),
-                                          rm_time)
-
-
-def run_cleaner(path, rm_time):
-    """ Run cleaner """
-    logging.info("Searching files to removal in %s", path)
-    for file in scantree_gen_files_to_removal(path, rm_time):
-        logger.info("File to removal found: %s", file)
+    """ Scan file tree and yield files older than rm_time """
+    for entry in scantree_gen_file_entries(path):
+        try:
+            recent_access_time = root_stat_limiter().call(
+                entry.stat, follow_symlinks=False).st_atime
+        except OSError:
+            continue  # removed meanwhile
+        if recent_access_time < rm_time:
+            yield entry.path
+
+
+def scantree_gen_file_usage(path, rules=None):
+    """ Scan file tree and yield (atime, size, path) of every file """
+    for entry in scantree_gen_file_entries(path, rules):
         try:
-            os.remove(file)
-        except:
-            logger.info("Failed to remove file: %s, file skipped.", file)
+            stat = root_stat_limiter().call(entry.stat, follow_symlinks=False)
+        except OSError:
+            continue  # removed meanwhile
+        yield stat.st_atime, stat.st_size, entry.path
+
+
+def select_oldest_files(path, excess, max_files=100000, rules=None,
+                        quota=None):
+    """
+    Select least recently accessed files to free @excess bytes
+
+    Files are streamed through a heap keeping the newest of selected ones
+    on top: it is dropped as soon as the rest still frees @excess bytes,
+    so only files that are going to be removed are held in memory.
+    If more than @max_files are needed, the oldest @max_files are
+    selected and caller should make another pass for the rest.
+    When usage is not known before the pass, @excess is None: the oldest
+    @max_files are held and cut to usage over @quota when the pass is done.
+
+    Arguments:
+        - path: root folder
+        - excess: amount of bytes to be freed, None for usage over @quota
+        - max_files: max amount of selected files kept in memory
+        - rules: optional Rules, excluded files are not selected
+        - quota: target total size of files, used when @excess is None
+
+    Returns:
+        - (files, usage): files as (atime, size, path) oldest first,
+            usage is total size of files in the tree
+            (excluded files are not counted)
+    """
+    heap = []  # (-atime, size, path), newest selected file on top
+    selected = 0
+    usage = 0
+    limited = excess is not None
+    for atime, size, filepath in scantree_gen_file_usage(path, rules):
+        usage += size
+        if heap and atime >= -heap[0][0] and (
+                limited and selected >= excess or len(heap) >= max_files):
+            continue  # newer than all selected files, not needed
+        heapq.heappush(heap, (-atime, size, filepath))
+        selected += size
+        while heap and (limited and selected - heap[0][1] >= excess or
+                        len(heap) > max_files):
+            selected -= heapq.heappop(heap)[1]
+
+    files = sorted((-atime, size, filepath) for atime, size, filepath in heap)
+    if not limited:
+        # oldest files freeing usage over quota
+        freed = 0
+        for k, (_, size, _) in enumerate(files):
+            if freed >= usage - quota:
+                del files[k:]
+                break
+            freed += size
+    return files, usage
+
+
+def scantree_clean_quota(path, quota, remover=None, max_files=100000,
+                         rules=None):
+    """
+    Remove least recently accessed files until usage is under @quota
+
+    Tree is scanned once per round, each round removes at most @max_files
+    files. Usage is measured by the same scan, after a round it is lowered
+    by the size of removed files, so the tree is scanned again only when
+    they were not enough. Emptied folders are not pruned, see
+    scantree_remove_empty_folders.
+
+    Arguments:
+        - path: root folder
+        - quota: target total size of files in bytes
+        - remover: FileRemover (default) or DeletePipeline,
+            pipeline should be closed by caller
+        - max_files: max amount of files selected in one round
+        - rules: optional Rules, excluded files are neither removed
+            nor counted in usage
+
+    Returns:
+        - (remover, usage): usage is size of files left in bytes
+    """
+    if remover is None:
+        remover = FileRemover()
+    lock = remover.lock
+
+    usage = None  # not known before the first pass
+    while usage is None or usage > quota:
+        excess = usage - quota if usage is not None else None
+        files, usage = select_oldest_files(path, excess, max_files, rules,
+                                           quota)
+        logger.info("Usage of %s is %i bytes, quota is %i bytes",
+                    path, usage, quota)
+        if usage <= quota or not files:
+            break  # usage measured by this pass is fine already
+
+        removed, freed = remover.removed, remover.freed
+        # files of different folders are resolved in root, never removed
+        root = Folder(path)
+        for _, size, filepath in files:
+            with lock:
+                root.pending += 1
+            remover.submit(filepath, root, size)
+        resolve_folder(root, lock=lock)
+        remover.flush()
+
+        if remover.removed == removed:
+            logger.info("Failed to remove any of selected files, "
+                        "quota is not reached.")
+            break
+        usage -= remover.freed - freed  # failed files are still there
+
+    return remover, usage
+
+
+def parse_size(text):
+    """ Parse size in bytes with optional K, M, G or T suffix, e.g. 20G """
+    text = text.strip().upper()
+    units = "KMGT"
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * 1024 ** (units.index(text[-1]) + 1))
+    return int(text)
+
+
+def parse_rate(text):
+    """ Parse positive amount of operations per second, e.g. 50 or 0.5 """
+    try:
+        rate = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid rate: %r" % text)
+    if not rate > 0:  # also rejects nan
+        raise argparse.ArgumentTypeError("rate should be positive: %r" % text)
+    return rate
+
+
+def run_quota_cleaner(path, quota, workers=8, queue_size=1000,
+                      max_files=100000, remover=None, rules=None):
+    """
+    Run cleaner in quota mode: remove oldest files and emptied folders
+
+    Arguments:
+        - quota: target total size of files in bytes
+        - workers: amount of deleter threads, 0 to remove files
+            in scanning thread
+        - queue_size: max amount of files waiting for deleters
+        - max_files: max amount of files selected in one scan of the tree
+        - remover: remover to use instead of creating one, e.g. DeleteLane
+        - rules: optional Rules of protected files
+    """
+    if remover is None and workers > 0:
+        remover = DeletePipeline(workers, queue_size)
+    elif remover is None:
+        remover = FileRemover()
+    removed, failed = remover.removed, remover.failed
+
+    remover, usage = scantree_clean_quota(path, quota, remover, max_files,
+                                          rules)
+    remover.close()
+    if remover.removed > removed:
+        scantree_remove_empty_folders(path, rules)
+
+    logger.info("Removed %i files (%i failed) to fit quota in %s, "
+                "usage %i bytes", remover.removed - removed,
+                remover.failed - failed, path, usage)
+    return remover
+
 
-    logger.info("Removing empty folders in %s", path)
-    scantree_remove_empty_folders(path)
+def run_cleaner(path, rm_time, workers=8, queue_size=1000, index_path=None,
+                remover=None, rules=None):
+    """
+    Run cleaner
+
+    Arguments:
+        - workers: amount of deleter threads, 0 to remove files
+            in scanning thread
+        - queue_size: max amount of files waiting for deleters
+        - index_path: sqlite file of FolderIndex, None to scan everything
+        - remover: remover to use instead of creating one, e.g. DeleteLane
+        - rules: optional Rules of protected files
+    """
+    logger.info("Removing files older than %s and empty folders in %s",
+                time.ctime(rm_time), path)
+    if remover is None and workers > 0:
+        remover = DeletePipeline(workers, queue_size)
+    elif remover is None:
+        remover = FileRemover()
+
+    index = None
+    if index_path:
+        index = FolderIndex(index_path, rules.signature if rules else "")
+    scantree_clean(path, rm_time, remover, index, rules)
+    remover.close()
+    if index is not None:
+        logger.info("Folders not changed since last run: %i", index.reused)
+        index.close()
+
+    logger.info("Removed %i files (%i failed) in %s in %.1f s, "
+                "%.1f files/s", remover.removed, remover.failed, path,
+                time.time() - remover.started, remover.rate())
+    return remover
+
+
+class Root(object):
+    """
+    Root folder cleaned with its own policy
+
+    Arguments:
+        - path: folder to be cleaned
+        - days: files not accessed for this amount of days are removed
+        - quota: optional max total size of files left, bytes
+        - workers: max amount of files of the root removed at once
+        - index: optional sqlite file of FolderIndex
+        - rules: optional Rules of protected files
+    """
+
+    def __init__(self, path, days=30, quota=None, workers=4, index=None,
+                 rules=None):
+        self.path = path
+        self.days = days
+        self.quota = quota
+        self.workers = workers
+        self.index = index
+        self.rules = rules
+
+
+def protect_log(root, log_path):
+    """
+    Exclude log file and its rotated files from cleaning of @root
+
+    Log is never accessed by cleaning, so otherwise it would be removed
+    as soon as it gets old, and first of all in quota mode.
+
+    Arguments:
+        - root: Root, its rules are replaced if log is inside of it
+        - log_path: path of log file
+    """
+    try:
+        relpath = os.path.relpath(os.path.abspath(log_path),
+                                  os.path.abspath(root.path))
+    except ValueError:
+        return  # on another drive
+    if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+        return
+    pattern = "re:^%s(?:[.][0-9]+(?:[.]gz)?)?$" % re.escape(
+        relpath.replace(os.sep, "/"))
+    rules = root.rules or Rules()
+    root.rules = Rules(rules.exclude_patterns + [pattern],
+                       rules.include_patterns)
+
+
+def read_config(path):
+    """
+    Read roots from ini file, every section is a root
+
+        [DEFAULT]
+        days = 30
+        workers = 4
+
+        [builds]
+        path = /mnt/share/builds
+        quota = 500G
+        index = /var/lib/dircleaner/builds.sqlite
+        exclude = releases
+            *.keep
+        include = re:[.](o|obj|tmp)$
+
+    Exclude and include patterns are one per line, see compile_patterns.
+
+    Returns:
+        - list of Root
+    """
+    config = configparser.ConfigParser()
+    with open(path) as f:
+        config.read_file(f)
+
+    roots = []
+    for name in config.sections():
+        section = config[name]
+        quota = section.get("quota")
+        exclude = section.get("exclude", "").split("\n")
+        exclude = [pattern.strip() for pattern in exclude if pattern.strip()]
+        include = section.get("include", "").split("\n")
+        include = [pattern.strip() for pattern in include if pattern.strip()]
+        roots.append(Root(section.get("path", name),
+                          section.getint("days", 30),
+                          parse_size(quota) if quota else None,
+                          section.getint("workers", 4),
+                          section.get("index"),
+                          Rules(exclude, include)
+                          if exclude or include else None))
+    return roots
+
+
+def clean_root(root, remover, max_files=100000):
+    """ Clean @root with its policy, removing files with @remover """
+    use_root_limiters(getattr(remover, "limiters", None))
+    try:
+        rm_time = calculate_days_ago_in_sec(time.time(), root.days)
+        run_cleaner(root.path, rm_time, index_path=root.index,
+                    remover=remover, rules=root.rules)
+        if root.quota is not None:
+            run_quota_cleaner(root.path, root.quota, max_files=max_files,
+                              remover=remover, rules=root.rules)
+    except Exception:
+        logger.exception("Failed to clean %s", root.path)
+
+
+def run_roots(roots, workers=8, queue_size=1000, max_files=100000,
+              max_stats=None, max_deletes=None, backoff=False):
+    """
+    Clean several roots at once
+
+    Every root is scanned in its own thread, files are removed by shared
+    DeleteScheduler threads, at most root.workers of them at once per root.
+    Every root has its own rate limits and backoff, so a slow share does
+    not slow down the others.
+
+    Arguments:
+        - roots: list of Root
+        - workers: amount of deleter threads shared by all roots
+        - queue_size: max amount of files waiting for removal per root
+        - max_stats: stat calls per second per root, None for module limiter
+        - max_deletes: removals per second per root, None for module limiter
+        - backoff: adapt rates to latency of every root, see RateLimiter
+
+    Returns:
+        - list of DeleteLane of roots, with removal counters
+    """
+    scheduler = DeleteScheduler(max(workers, 1))
+    lanes = [scheduler.lane(
+        root.workers, queue_size,
+        (RateLimiter(max_stats, backoff=backoff) if max_stats else None,
+         RateLimiter(max_deletes, backoff=backoff) if max_deletes else None))
+        for root in roots]
+    scanners = [threading.Thread(target=clean_root,
+                                 args=(root, lane, max_files))
+                for root, lane in zip(roots, lanes)]
+    for scanner in scanners:
+        scanner.start()
+    for scanner in scanners:
+        scanner.join()
+    scheduler.close()
+
+    logger.info("Removed %i files (%i failed) in %i roots",
+                sum(lane.removed for lane in lanes),
+                sum(lane.failed for lane in lanes), len(roots))
+    return lanes
 
 
 def parse_arguments():
@@ -78,31 +1168,303 @@ def parse_arguments():
     parser.add_argument('path',
                         metavar='path',
                         type=str,
+                        nargs='*',
                         help='path to be cleaned recursively down the tree.'
-                             'E.g. "C:\\testfolder"')
-    return parser.parse_args()
+                             'E.g. "C:\\testfolder", several paths are '
+                             'cleaned at once')
+    parser.add_argument('--config',
+                        metavar='FILE',
+                        default=None,
+                        help='ini file with roots to be cleaned at once, '
+                             'section per root with path, days, quota, '
+                             'workers, index, exclude and include')
+    parser.add_argument('--exclude',
+                        metavar='PATTERN',
+                        action='append',
+                        default=[],
+                        help='protect matching files and folders, glob of '
+                             'name, glob of relative path with "/" or '
+                             '"re:" and regular expression, repeatable')
+    parser.add_argument('--include',
+                        metavar='PATTERN',
+                        action='append',
+                        default=[],
+                        help='remove only matching files, same patterns '
+                             'as --exclude, repeatable')
+    parser.add_argument('--root-workers',
+                        type=int,
+                        default=4,
+                        help='max amount of files of one root removed at '
+                             'once when several roots are cleaned (default 4)')
+    parser.add_argument('--days',
+                        type=int,
+                        default=30,
+                        help='remove files not accessed for this amount '
+                             'of days (default 30)')
+    parser.add_argument('--quota',
+                        type=parse_size,
+                        default=None,
+                        help='after removing old files remove least '
+                             'recently accessed ones until total size is '
+                             'under quota, e.g. 500G')
+    parser.add_argument('--max-files',
+                        type=int,
+                        default=100000,
+                        help='max amount of files held in memory in quota '
+                             'mode, more passes are made if needed')
+    parser.add_argument('--workers',
+                        type=int,
+                        default=8,
+                        help='amount of threads removing files, '
+                             '0 removes them in scanning thread (default 8)')
+    parser.add_argument('--queue-size',
+                        type=int,
+                        default=1000,
+                        help='max amount of files waiting for removal')
+    parser.add_argument('--index',
+                        metavar='FILE',
+                        default=None,
+                        help='sqlite file (local) keeping folders state '
+                             'between runs to skip unchanged folders, '
+                             'for single path only')
+    parser.add_argument('--max-stats',
+                        type=parse_rate,
+                        default=None,
+                        help='max stat calls and folder listings per second, '
+                             'per root when several roots are cleaned '
+                             '(default no limit)')
+    parser.add_argument('--max-deletes',
+                        type=parse_rate,
+                        default=None,
+                        help='max removals per second, per root when '
+                             'several roots are cleaned (default no limit)')
+    parser.add_argument('--backoff',
+                        action='store_true',
+                        help='lower --max-stats and --max-deletes while '
+                             'latency of file server grows')
+    parser.add_argument('--log',
+                        metavar='FILE',
+                        default=None,
+                        help='log file, keep it local, it is never removed '
+                             'by cleaning (default dircleaner.log in '
+                             'current folder)')
+    parser.add_argument('--log-summary',
+                        action='store_true',
+                        help='log only summary of the run, not every file')
+    parser.add_argument('--log-max-bytes',
+                        type=parse_size,
+                        default=0,
+                        help='rotate log file when it is over this size, '
+                             'e.g. 10M (default never)')
+    parser.add_argument('--log-backups',
+                        type=int,
+                        default=5,
+                        help='amount of rotated log files kept (default 5)')
+    parser.add_argument('--log-compress',
+                        action='store_true',
+                        help='gzip rotated log files')
+    args = parser.parse_args()
+    if not args.path and not args.config:
+        parser.error("path or --config is required")
+    if args.index and (len(args.path) > 1 or args.config):
+        parser.error("--index is for single path, set index per root "
+                     "in --config")
+    return args
+
+
+class BatchFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Log file handler writing records in batches
+
+    Formatted records are buffered and written with a single write when
+    @capacity of them are collected, when the oldest of them waits for
+    @flush_interval seconds, on warnings and on close. File is rotated
+    when it grows over @max_bytes, rotated files are gzip compressed if
+    @compress is set. Records are only checked for age when a new one
+    comes, BatchQueueListener flushes the handler when there are none.
+
+    Arguments:
+        - filename: path of log file
+        - capacity: amount of records written at once
+        - max_bytes: size of file to rotate it, 0 to never rotate
+        - backup_count: amount of rotated files kept
+        - compress: gzip rotated files
+        - flush_interval: max seconds record is kept in buffer
+    """
+
+    def __init__(self, filename, capacity=1000, max_bytes=0, backup_count=5,
+                 compress=False, flush_interval=1.0):
+        logging.handlers.RotatingFileHandler.__init__(
+            self, filename, maxBytes=max_bytes, backupCount=backup_count,
+            delay=True)
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.buffer = []
+        self.buffered = None  # time of the oldest buffered record
+        if compress:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = gzip_rotator
+
+    def emit(self, record):
+        try:
+            self.buffer.append(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+            return
+        now = time.monotonic()
+        if self.buffered is None:
+            self.buffered = now
+        if (len(self.buffer) >= self.capacity or
+                record.levelno >= logging.WARNING or
+                now - self.buffered >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if not self.buffer:
+                return
+            text = "".join(self.buffer)
+            self.buffer = []
+            self.buffered = None
+            if self.stream is None:
+                self.stream = self._open()
+            if (self.maxBytes > 0 and self.stream.tell() > 0 and
+                    self.stream.tell() + len(text) >= self.maxBytes):
+                self.doRollover()
+                if self.stream is None:  # reopened lazily
+                    self.stream = self._open()
+            self.stream.write(text)
+            self.stream.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        logging.handlers.RotatingFileHandler.close(self)
+
 
+class BatchQueueListener(logging.handlers.QueueListener):
+    """
+    Queue listener flushing its handlers when no records come
 
-def init_logger(path):
+    Waits for a record at most @flush_interval seconds, so records
+    buffered by BatchFileHandler are written during a quiet period
+    (e.g. a long scan of unchanged folders) and not only at the end.
+    """
+
+    def __init__(self, records, *handlers, flush_interval=1.0):
+        logging.handlers.QueueListener.__init__(self, records, *handlers)
+        self.flush_interval = flush_interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get(block, self.flush_interval)
+            except queue.Empty:
+                if not block:
+                    raise
+                for handler in self.handlers:
+                    handler.flush()
+
+
+def gzip_rotator(source, dest):
+    """ Rotate log file @source into gzip compressed @dest """
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        f_out.writelines(f_in)
+    os.remove(source)
+
+
+def init_logger(path, log_path=None, summary=False, capacity=1000,
+                max_bytes=0, backup_count=5, compress=False,
+                flush_interval=1.0):
+    """
+    Log to a file written in batches by a background thread
+
+    Cleaning threads only put records to a queue, so removals are not held
+    by log writes. Log should be kept on local disk, not on the share
+    being cleaned.
+
+    Arguments:
+        - path: cleaned folder, log is written into it by default
+        - log_path: path of log file, default is dircleaner.log in @path,
+            it should be protected from cleaning with protect_log
+        - summary: log only summary of the run, not every file
+        - capacity, max_bytes, backup_count, compress, flush_interval:
+            see BatchFileHandler
+
+    Returns:
+        - (logger, listener): listener should be stopped with stop_logger
+    """
     logger = logging.getLogger(__name__)
     logger.setLevel(logging.INFO)
 
-    logfile_name = os.path.join(path, "dircleaner.log")
-    fileHandler = logging.FileHandler(filename=logfile_name)
+    if log_path is None:
+        log_path = os.path.join(path, "dircleaner.log")
+    fileHandler = BatchFileHandler(log_path, capacity, max_bytes,
+                                   backup_count, compress, flush_interval)
     fileHandler.setLevel(logging.INFO)
     fileHandler.setFormatter(
         logging.Formatter(fmt="%(asctime)s [%(levelname)s] - %(message)s",
                           datefmt="%Y-%m-%d %H:%M:%S"))
-    logger.addHandler(fileHandler)
 
-    return logger
+    records = queue.Queue()
+    queueHandler = logging.handlers.QueueHandler(records)
+    if summary:
+        queueHandler.addFilter(
+            lambda record: not getattr(record, "per_file", False))
+    logger.addHandler(queueHandler)
+
+    listener = BatchQueueListener(records, fileHandler,
+                                  flush_interval=flush_interval)
+    listener.start()
+    return logger, listener
+
+
+def stop_logger(logger, listener):
+    """ Write all queued records and close log file """
+    for handler in logger.handlers[:]:
+        if getattr(handler, "queue", None) is listener.queue:
+            logger.removeHandler(handler)
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
 
 
 if __name__ == '__main__':
 
     args = parse_arguments()
-    path = args.path
-    rm_time = calculate_days_ago_in_sec(time.time())
+    rules = None
+    if args.exclude or args.include:
+        rules = Rules(args.exclude, args.include)
+    roots = [Root(path, args.days, args.quota, args.root_workers,
+                  rules=rules)
+             for path in args.path]
+    if args.config:
+        roots += read_config(args.config)
+    path = roots[0].path
+    rm_time = calculate_days_ago_in_sec(time.time(), args.days)
+    log_path = os.path.abspath(args.log or "dircleaner.log")
+    for root in roots:
+        protect_log(root, log_path)
+    rules = roots[0].rules
+    stat_limiter = RateLimiter(args.max_stats, backoff=args.backoff)
+    delete_limiter = RateLimiter(args.max_deletes, backoff=args.backoff)
 
-    logger = init_logger(path)
-    run_cleaner(path, rm_time)
+    logger, listener = init_logger(path, log_path, args.log_summary,
+                                   max_bytes=args.log_max_bytes,
+                                   backup_count=args.log_backups,
+                                   compress=args.log_compress)
+    try:
+        if len(roots) > 1 or args.config:
+            run_roots(roots, args.workers, args.queue_size, args.max_files,
+                      args.max_stats, args.max_deletes, args.backoff)
+        else:
+            run_cleaner(path, rm_time, args.workers, args.queue_size,
+                        args.index, rules=rules)
+            if args.quota is not None:
+                run_quota_cleaner(path, args.quota, args.workers,
+                                  args.queue_size, args.max_files,
+                                  rules=rules)
+    finally:
+        stop_logger(logger, listener)
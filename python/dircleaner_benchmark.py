@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""
+    Dircleaner benchmark.
+
+    Generates synthetic file trees and measures time spent by dircleaner
+    on scanning, removing old files and pruning emptied folders, and the
+    single pass cleaning doing all of it at once. Calls to the file system
+    are counted at the points guarded by dircleaner rate limiters, so
+    syscalls per file could be tracked along with time.
+
+    Tree is generated in a temporary folder under --path, it should be on
+    the file system being measured:
+
+        python3 dircleaner_benchmark.py --depth 3 --fanout 10 --files 100
+        python3 dircleaner_benchmark.py --path /mnt/share --workers 16
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+import dircleaner
+
+
+def generate_tree(path, depth=3, fanout=10, files=100, old_ratio=0.5,
+                  days_old=40, seed=None):
+    """
+    Generate tree of folders with files, part of them backdated
+
+    Every folder down to @depth levels gets @fanout subfolders and @files
+    empty files. Access time of @old_ratio of files is set @days_old days
+    back with os.utime, so they are old for dircleaner, other files are
+    just created.
+
+    Arguments:
+        - path: existing folder to generate tree in
+        - depth: levels of folders, 1 means only files in @path
+        - fanout: amount of subfolders in every folder
+        - files: amount of files in every folder
+        - old_ratio: share of backdated files
+        - days_old: age of backdated files in days
+        - seed: random seed, same seed gives same tree
+
+    Returns:
+        - dict with amount of "folders", "files" and "old" files
+    """
+    rnd = random.Random(seed)
+    old_time = time.time() - timedelta(days=days_old).total_seconds()
+    stats = {"folders": 0, "files": 0, "old": 0}
+
+    folders = [(path, 1)]
+    while folders:
+        folder, level = folders.pop()
+        for i in range(files):
+            filepath = os.path.join(folder, "f%i" % i)
+            with open(filepath, "w"):
+                pass
+            stats["files"] += 1
+            if rnd.random() < old_ratio:
+                os.utime(filepath, (old_time, old_time))
+                stats["old"] += 1
+        if level < depth:
+            for i in range(fanout):
+                subfolder = os.path.join(folder, "d%i" % i)
+                os.mkdir(subfolder)
+                stats["folders"] += 1
+                folders.append((subfolder, level + 1))
+    return stats
+
+
+class CountingLimiter(dircleaner.RateLimiter):
+    """ RateLimiter without limit counting calls by function name """
+
+    def __init__(self, calls):
+        dircleaner.RateLimiter.__init__(self)
+        self.calls = calls
+
+    def call(self, func, *args, **kwargs):
+        name = func.__name__
+        self.calls[name] = self.calls.get(name, 0) + 1
+        return func(*args, **kwargs)
+
+
+def measure(func, *args):
+    """
+    Run @func with file system calls counted
+
+    Returns:
+        - (seconds, calls): calls is dict of call counts by function name
+    """
+    calls = {}
+    stat_limiter = dircleaner.stat_limiter
+    delete_limiter = dircleaner.delete_limiter
+    dircleaner.stat_limiter = CountingLimiter(calls)
+    dircleaner.delete_limiter = CountingLimiter(calls)
+    try:
+        started = time.perf_counter()
+        func(*args)
+        seconds = time.perf_counter() - started
+    finally:
+        dircleaner.stat_limiter = stat_limiter
+        dircleaner.delete_limiter = delete_limiter
+    return seconds, calls
+
+
+def make_remover(workers):
+    if workers > 0:
+        return dircleaner.DeletePipeline(workers)
+    return dircleaner.FileRemover()
+
+
+def benchmark(base, workers=8, **kwargs):
+    """
+    Measure phases of cleaning on generated trees
+
+    Separate phases run on one tree: scan finds old files, delete removes
+    them, prune removes emptied folders. Single pass cleaning
+    (scantree_clean) runs on another tree generated the same way.
+
+    Arguments:
+        - base: folder to generate trees in
+        - workers: deleter threads, 0 to remove in scanning thread
+        - kwargs: generate_tree arguments
+
+    Returns:
+        - (tree, phases): tree is generate_tree statistics, phases is list
+            of (name, seconds, calls)
+    """
+    rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+    phases = []
+
+    path = tempfile.mkdtemp(dir=base)
+    try:
+        tree = generate_tree(path, **kwargs)
+        old_files = []
+
+        def scan():
+            old_files.extend(
+                dircleaner.scantree_gen_files_to_removal(path, rm_time))
+
+        def delete():
+            remover = make_remover(workers)
+            root = dircleaner.Folder(path)
+            for filepath in old_files:
+                with remover.lock:
+                    root.pending += 1
+                remover.submit(filepath, root)
+            remover.close()
+
+        phases.append(("scan",) + measure(scan))
+        phases.append(("delete",) + measure(delete))
+        phases.append(("prune",) + measure(
+            dircleaner.scantree_remove_empty_folders, path))
+    finally:
+        shutil.rmtree(path)
+
+    path = tempfile.mkdtemp(dir=base)
+    try:
+        generate_tree(path, **kwargs)
+
+        def clean():
+            remover = make_remover(workers)
+            dircleaner.scantree_clean(path, rm_time, remover)
+            remover.close()
+
+        phases.append(("single pass clean",) + measure(clean))
+    finally:
+        shutil.rmtree(path)
+
+    return tree, phases
+
+
+def print_report(tree, phases):
+    """ Print time and file system calls per file of every phase """
+    print("tree: %i folders, %i files, %i old" % (
+        tree["folders"], tree["files"], tree["old"]))
+    files = max(tree["files"], 1)
+    for name, seconds, calls in phases:
+        print("    %-18s %10.3f s %12.0f files/s %8.2f calls/file" % (
+            name, seconds, files / seconds if seconds > 0 else 0,
+            sum(calls.values()) / float(files)))
+        for func, count in sorted(calls.items()):
+            print("        %-14s %10i %8.2f/file" % (
+                func, count, count / float(files)))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Benchmark dircleaner on generated file trees')
+    parser.add_argument('--path', default=None,
+                        help='folder to generate trees in, on measured '
+                             'file system (default system temp folder)')
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=10)
+    parser.add_argument('--files', type=int, default=100,
+                        help='files in every folder')
+    parser.add_argument('--old-ratio', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=8,
+                        help='deleter threads, 0 removes in scanning thread')
+    return parser.parse_args()
+
+
+def run():
+    """ Run benchmark with parameters from command line """
+    args = parse_arguments()
+    tree, phases = benchmark(args.path, args.workers, depth=args.depth,
+                             fanout=args.fanout, files=args.files,
+                             old_ratio=args.old_ratio, seed=args.seed)
+    print_report(tree, phases)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -4,44 +4,56 @@ Created on Apr 2, 2012
 @author: Mykhailo.Pershyn
 '''
 import unittest
+import gzip
+import logging
 import os
 from datetime import timedelta
 import time
 import dircleaner
+import dircleaner_benchmark
 import shutil
+import tempfile
+import threading
 
 
-def create_tree(path, depth, amount):
-    """ creates test tree of defined depth - empty folders """
+def create_file(path, days_old=0, size=0):
+    """ creates file of @size bytes with access time @days_old days ago """
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    atime = time.time() - timedelta(days=days_old).total_seconds()
+    os.utime(path, (atime, atime))
+
+
+def create_tree(path, depth, amount, files=0, days_old=0):
+    """ creates test tree of defined depth, @files in every new folder """
     # depth 1 means this folder
     if depth < 1:
         return
     for i in range(amount):
         newpath = os.path.join(path, "test" + str(i))
-        print("Creating folder: %s", newpath)
         os.mkdir(newpath)
-        create_tree(newpath, depth - 1, amount)
+        for j in range(files):
+            create_file(os.path.join(newpath, "file" + str(j)), days_old)
+        create_tree(newpath, depth - 1, amount, files, days_old)
     return
 
 
 class TestDirCleaner(unittest.TestCase):
 
 
-    path = "C:/dircleaner-testfolder/"
-
-
     def setUp(self):
         """ Create folder with bunch of files to test on """
-        os.mkdir(self.path)
+        self.path = tempfile.mkdtemp()
         create_tree(self.path, depth=2, amount=10)
-        pass
+        # old files in test0/test0 and new file in test1/test1
+        create_tree(os.path.join(self.path, "test0", "test0"), depth=1,
+                    amount=2, files=3, days_old=40)
+        create_file(os.path.join(self.path, "test1", "test1", "new"))
 
 
     def tearDown(self):
         """ Clean the folder back """
-        print("Removing test folder: %s", self.path)
         shutil.rmtree(self.path)
-        pass
 
 
     def test_calculate_days_ago_in_sec(self):
@@ -55,11 +67,606 @@ class TestDirCleaner(unittest.TestCase):
 
 
     def test_scantree_remove_empty_folders(self):
-        pass
+        dircleaner.scantree_remove_empty_folders(self.path)
+        # only folders with files are left
+        self.assertEqual(sorted(["test0", "test1"]),
+                         sorted(os.listdir(self.path)))
+        self.assertEqual(["test0"],
+                         os.listdir(os.path.join(self.path, "test0")))
+        self.assertEqual(["new"],
+                         os.listdir(os.path.join(self.path, "test1",
+                                                 "test1")))
 
 
     def test_scantree_gen_files_to_removal(self):
-        pass
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        found = list(dircleaner.scantree_gen_files_to_removal(self.path,
+                                                              rm_time))
+        self.assertEqual(6, len(found))
+        for path in found:
+            self.assertEqual(os.path.join(self.path, "test0", "test0"),
+                             os.path.dirname(os.path.dirname(path)))
+
+
+class TestScanTree(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.path, "a", "b"))
+        create_file(os.path.join(self.path, "old"), days_old=40)
+        create_file(os.path.join(self.path, "new"))
+        create_file(os.path.join(self.path, "a", "old"), days_old=40)
+        create_file(os.path.join(self.path, "a", "b", "old"), days_old=40)
+        create_file(os.path.join(self.path, "a", "b", "new"))
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_scantree_gen_file_entries(self):
+        found = sorted(os.path.relpath(e.path, self.path) for e in
+                       dircleaner.scantree_gen_file_entries(self.path))
+        expected = sorted(["old", "new", os.path.join("a", "old"),
+                           os.path.join("a", "b", "old"),
+                           os.path.join("a", "b", "new")])
+        self.assertEqual(expected, found)
+
+    def test_scantree_gen_files_to_removal(self):
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        found = sorted(os.path.relpath(p, self.path) for p in
+                       dircleaner.scantree_gen_files_to_removal(self.path,
+                                                                rm_time))
+        expected = sorted(["old", os.path.join("a", "old"),
+                           os.path.join("a", "b", "old")])
+        self.assertEqual(expected, found)
+
+    def test_scantree_clean(self):
+        os.makedirs(os.path.join(self.path, "empty", "nested"))
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        dircleaner.scantree_clean(self.path, rm_time)
+
+        left = sorted(os.path.relpath(os.path.join(dirpath, name), self.path)
+                      for dirpath, dirnames, filenames in os.walk(self.path)
+                      for name in dirnames + filenames)
+        # "a" is kept as "a/b/new" is there
+        expected = sorted(["new", "a", os.path.join("a", "b"),
+                           os.path.join("a", "b", "new")])
+        self.assertEqual(expected, left)
+
+    def test_scantree_clean_cascade(self):
+        os.remove(os.path.join(self.path, "a", "b", "new"))
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        dircleaner.scantree_clean(self.path, rm_time)
+        self.assertEqual(["new"], os.listdir(self.path))
+
+    def test_scantree_remove_empty_folders(self):
+        os.makedirs(os.path.join(self.path, "empty", "nested"))
+        dircleaner.scantree_remove_empty_folders(self.path)
+        self.assertFalse(os.path.exists(os.path.join(self.path, "empty")))
+        self.assertTrue(os.path.exists(os.path.join(self.path, "a", "old")))
+
+    def test_run_cleaner_pipeline(self):
+        for i in range(50):
+            folder = os.path.join(self.path, "many", str(i % 5))
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            create_file(os.path.join(folder, str(i)), days_old=40)
+
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        remover = dircleaner.run_cleaner(self.path, rm_time, workers=4,
+                                         queue_size=3)
+        self.assertEqual(53, remover.removed)
+        self.assertEqual(0, remover.failed)
+        self.assertFalse(os.path.exists(os.path.join(self.path, "many")))
+        self.assertEqual(sorted(["a", "new"]), sorted(os.listdir(self.path)))
+
+    def test_folder_index(self):
+        index_folder = tempfile.mkdtemp()
+        index_path = os.path.join(index_folder, "index.sqlite")
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+
+        def clean(rm_time):
+            index = dircleaner.FolderIndex(index_path)
+            remover = dircleaner.FileRemover()
+            dircleaner.scantree_clean(self.path, rm_time, remover, index)
+            index.close()
+            return remover.removed, index.reused
+
+        try:
+            self.assertEqual((3, 0), clean(rm_time))
+            # nothing changed, all 3 folders are taken from the index
+            self.assertEqual((0, 3), clean(rm_time))
+
+            # old file moved in changes only mtime of its folder
+            create_file(os.path.join(self.path, "a", "b", "moved"),
+                        days_old=40)
+            self.assertEqual((1, 2), clean(rm_time))
+            self.assertEqual(["new"],
+                             os.listdir(os.path.join(self.path, "a", "b")))
+
+            # unchanged folders are listed once their files could expire,
+            # "a" without own files is still taken from the index
+            self.assertEqual((2, 1), clean(time.time() + 60))
+            self.assertEqual([], os.listdir(self.path))
+        finally:
+            shutil.rmtree(index_folder)
+
+    def test_keep_file_locked(self):
+        lock = threading.Lock()
+        unlocked = []
+        keep_file = dircleaner.Folder.keep_file
+
+        def checked_keep_file(folder, atime=None):
+            if not lock.locked():
+                unlocked.append(folder.path)
+            keep_file(folder, atime)
+
+        remover = dircleaner.FileRemover()
+        remover.lock = lock
+        rules = dircleaner.Rules(exclude=["b"])
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        dircleaner.Folder.keep_file = checked_keep_file
+        try:
+            dircleaner.scantree_clean(self.path, rm_time, remover,
+                                      rules=rules)
+        finally:
+            dircleaner.Folder.keep_file = keep_file
+        # folder is updated by deleter threads too
+        self.assertEqual([], unlocked)
+
+    def test_folder_index_failed_removal(self):
+        index_folder = tempfile.mkdtemp()
+        index_path = os.path.join(index_folder, "index.sqlite")
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        remove = os.remove
+
+        def failing_remove(path):
+            raise OSError("locked")
+
+        def clean():
+            index = dircleaner.FolderIndex(index_path)
+            remover = dircleaner.FileRemover()
+            dircleaner.scantree_clean(self.path, rm_time, remover, index)
+            index.close()
+            return remover.removed, index.reused
+
+        try:
+            dircleaner.os.remove = failing_remove
+            try:
+                self.assertEqual((0, 0), clean())
+            finally:
+                dircleaner.os.remove = remove
+            # folders of files that failed are listed again
+            self.assertEqual((3, 0), clean())
+            self.assertEqual((0, 3), clean())
+        finally:
+            shutil.rmtree(index_folder)
+
+    def test_select_oldest_files(self):
+        path = os.path.join(self.path, "a", "b")
+        for i in range(10):
+            create_file(os.path.join(path, "q%i" % i),
+                        days_old=20 - i, size=100)
+        files, usage = dircleaner.select_oldest_files(path, 250)
+        self.assertEqual(1000, usage)
+        # empty "old" file is accessed before all others
+        self.assertEqual(["old", "q0", "q1", "q2"],
+                         [os.path.basename(f[2]) for f in files])
+
+        files, usage = dircleaner.select_oldest_files(path, 250,
+                                                      max_files=2)
+        self.assertEqual(["old", "q0"],
+                         [os.path.basename(f[2]) for f in files])
+
+    def test_scantree_clean_quota(self):
+        for i in range(10):
+            create_file(os.path.join(self.path, "a", "b", "q%i" % i),
+                        days_old=20 - i, size=100)
+        remover, usage = dircleaner.scantree_clean_quota(
+            self.path, 450, dircleaner.DeletePipeline(2), max_files=2)
+        remover.close()
+        self.assertEqual(400, usage)
+        # empty files accessed 40 days ago go first, then q0 .. q5
+        self.assertEqual(9, remover.removed)
+        self.assertEqual(sorted(["new", "q6", "q7", "q8", "q9"]),
+                         sorted(os.listdir(os.path.join(self.path, "a", "b"))))
+
+    def test_quota_scans(self):
+        for i in range(10):
+            create_file(os.path.join(self.path, "a", "b", "q%i" % i),
+                        days_old=20 - i, size=100)
+        listed = []
+        scandir = os.scandir
+
+        def listing_scandir(path):
+            listed.append(os.path.relpath(path, self.path))
+            return scandir(path)
+
+        dircleaner.os.scandir = listing_scandir
+        try:
+            # selection measures usage, then emptied folders are pruned
+            dircleaner.run_quota_cleaner(self.path, 450, workers=0)
+            self.assertEqual(2, listed.count("."))
+            # usage is fine, nothing to prune
+            del listed[:]
+            dircleaner.run_quota_cleaner(self.path, 450, workers=0)
+            self.assertEqual(1, listed.count("."))
+        finally:
+            dircleaner.os.scandir = scandir
+        self.assertEqual(sorted(["new", "q6", "q7", "q8", "q9"]),
+                         sorted(os.listdir(os.path.join(self.path, "a", "b"))))
+
+    def test_scantree_clean_quota_failed(self):
+        for i in range(10):
+            create_file(os.path.join(self.path, "a", "b", "q%i" % i),
+                        days_old=20 - i, size=100)
+        remove = os.remove
+
+        def failing_remove(path):
+            if os.path.basename(path) == "q0":
+                raise OSError("locked")
+            remove(path)
+
+        dircleaner.os.remove = failing_remove
+        try:
+            remover, usage = dircleaner.scantree_clean_quota(self.path, 450)
+        finally:
+            dircleaner.os.remove = remove
+        # q0 is still there and fails again in the next round
+        self.assertEqual(500, usage)
+        self.assertEqual(sorted(["new", "q0", "q6", "q7", "q8", "q9"]),
+                         sorted(os.listdir(os.path.join(self.path, "a", "b"))))
+
+    def test_parse_size(self):
+        self.assertEqual(100, dircleaner.parse_size("100"))
+        self.assertEqual(1536, dircleaner.parse_size("1.5k"))
+        self.assertEqual(20 * 2 ** 30, dircleaner.parse_size("20G"))
+
+    def test_rules(self):
+        rules = dircleaner.Rules(exclude=["*.keep", "a/b", "re:^x/y+$"],
+                                 include=["*.tmp", "old"])
+        self.assertTrue(rules.prunes("a/b"))
+        self.assertTrue(rules.prunes("c/d/e.keep"))
+        self.assertTrue(rules.prunes("x/yy"))
+        self.assertFalse(rules.prunes("c/a/b"))
+        self.assertFalse(rules.prunes("x/yz"))
+        self.assertTrue(rules.allows("c/old"))
+        self.assertTrue(rules.allows("c/d.tmp"))
+        self.assertFalse(rules.allows("c/new"))
+        self.assertFalse(rules.allows("c.tmp.keep"))
+
+    def test_rules_nested(self):
+        rules = dircleaner.Rules(exclude=["a/*.keep", "[!x]?"],
+                                 include=["tmp*"])
+        # glob of name matches only the name, not folders above it
+        self.assertFalse(rules.allows("a/tmp_cache/keep/thesis.pdf"))
+        self.assertTrue(rules.allows("a/tmp_cache/tmp.pdf"))
+        self.assertTrue(rules.prunes("a/b.keep"))
+        self.assertFalse(rules.prunes("a/b/c.keep"))
+        self.assertTrue(rules.prunes("c/ab"))
+        self.assertFalse(rules.prunes("c/xb"))
+        self.assertFalse(rules.prunes("c/a/b"))
+        self.assertFalse(rules.prunes("c//b"))
+
+    def test_scantree_clean_rules(self):
+        listed = []
+        scandir = os.scandir
+
+        def listing_scandir(path):
+            listed.append(os.path.relpath(path, self.path))
+            return scandir(path)
+
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        rules = dircleaner.Rules(exclude=["b"])
+        dircleaner.os.scandir = listing_scandir
+        try:
+            dircleaner.scantree_clean(self.path, rm_time, rules=rules)
+        finally:
+            dircleaner.os.scandir = scandir
+
+        # excluded folder is not listed and its old file stays
+        self.assertEqual(sorted([".", "a"]), sorted(listed))
+        self.assertFalse(os.path.exists(os.path.join(self.path, "old")))
+        self.assertTrue(os.path.exists(os.path.join(self.path, "a", "b",
+                                                    "old")))
+
+    def test_scantree_clean_quota_rules(self):
+        for name in ["q1.tmp", "q2.log"]:
+            create_file(os.path.join(self.path, name), days_old=50, size=100)
+        rules = dircleaner.Rules(include=["*.tmp"])
+        remover, usage = dircleaner.scantree_clean_quota(self.path, 0,
+                                                         rules=rules)
+        self.assertEqual((1, 0), (remover.removed, usage))
+        self.assertTrue(os.path.exists(os.path.join(self.path, "q2.log")))
+
+    def test_folder_index_rules_changed(self):
+        index_folder = tempfile.mkdtemp()
+        index_path = os.path.join(index_folder, "index.sqlite")
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        try:
+            rules = dircleaner.Rules(exclude=["a"])
+            index = dircleaner.FolderIndex(index_path, rules.signature)
+            dircleaner.scantree_clean(self.path, rm_time, None, index, rules)
+            index.close()
+
+            # "a" is not in the index, so it is cleared for new rules
+            index = dircleaner.FolderIndex(index_path)
+            remover = dircleaner.scantree_clean(self.path, rm_time, None,
+                                                index)
+            index.close()
+        finally:
+            shutil.rmtree(index_folder)
+        self.assertEqual((2, 0), (remover.removed, index.reused))
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_generate_tree(self):
+        tree = dircleaner_benchmark.generate_tree(self.path, depth=3,
+                                                  fanout=2, files=4,
+                                                  old_ratio=0.5, seed=1)
+        self.assertEqual(2 + 4, tree["folders"])
+        self.assertEqual(7 * 4, tree["files"])
+
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        found = list(dircleaner.scantree_gen_files_to_removal(self.path,
+                                                              rm_time))
+        self.assertEqual(tree["old"], len(found))
+
+    def test_benchmark(self):
+        tree, phases = dircleaner_benchmark.benchmark(
+            self.path, workers=2, depth=2, fanout=2, files=5, old_ratio=1)
+        self.assertEqual(["scan", "delete", "prune", "single pass clean"],
+                         [name for name, seconds, calls in phases])
+        calls = dict((name, calls) for name, seconds, calls in phases)
+        self.assertEqual(15, calls["scan"]["stat"])
+        self.assertEqual(15, calls["delete"]["remove"])
+        self.assertEqual(2, calls["prune"]["rmdir"])
+        self.assertEqual(calls["single pass clean"]["remove"], 15)
+        self.assertEqual([], os.listdir(self.path))
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_rate(self):
+        limiter = dircleaner.RateLimiter(200, burst=1)
+        started = time.monotonic()
+        for _ in range(21):
+            limiter.acquire()
+        # first token is there, 20 more come in 0.1 s
+        self.assertTrue(time.monotonic() - started >= 0.09)
+
+    def test_no_limit(self):
+        limiter = dircleaner.RateLimiter()
+        self.assertEqual(3, limiter.call(len, "abc"))
+        self.assertIsNone(limiter.latency)
+
+    def test_positive_rate(self):
+        self.assertEqual(0.5, dircleaner.parse_rate("0.5"))
+        for text in ["0", "-1", "nan", "x"]:
+            self.assertRaises(dircleaner.argparse.ArgumentTypeError,
+                              dircleaner.parse_rate, text)
+        self.assertRaises(ValueError, dircleaner.RateLimiter, 0)
+
+    def test_backoff(self):
+        limiter = dircleaner.RateLimiter(1000, backoff=True)
+        for _ in range(10):
+            limiter.observe(0.002)
+        limiter.adjusted = 0  # adapt right now
+        limiter.observe(0.050)
+        self.assertEqual(500, limiter.rate)
+
+        for _ in range(50):
+            limiter.observe(0.002)
+        limiter.adjusted = 0
+        limiter.observe(0.002)
+        self.assertEqual(600, limiter.rate)
+
+    def test_backoff_base_decays(self):
+        limiter = dircleaner.RateLimiter(1000, backoff=True)
+        for _ in range(10):
+            limiter.observe(0.002)
+        # latency stays higher, it becomes the new base after a while
+        for _ in range(200):
+            limiter.adjusted = 0
+            limiter.observe(0.050)
+        self.assertEqual(1000, limiter.rate)
+        self.assertAlmostEqual(0.050, limiter.base_latency, places=3)
+
+    def test_limited_cleaning(self):
+        path = tempfile.mkdtemp()
+        try:
+            for i in range(10):
+                create_file(os.path.join(path, str(i)), days_old=40)
+            stat_limiter = dircleaner.stat_limiter
+            delete_limiter = dircleaner.delete_limiter
+            dircleaner.stat_limiter = dircleaner.RateLimiter(1000, burst=1)
+            dircleaner.delete_limiter = dircleaner.RateLimiter(100, burst=1,
+                                                               backoff=True)
+            try:
+                started = time.monotonic()
+                rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+                remover = dircleaner.scantree_clean(path, rm_time)
+                seconds = time.monotonic() - started
+                latency = dircleaner.delete_limiter.latency
+            finally:
+                dircleaner.stat_limiter = stat_limiter
+                dircleaner.delete_limiter = delete_limiter
+        finally:
+            shutil.rmtree(path)
+        self.assertEqual(10, remover.removed)
+        self.assertTrue(seconds >= 0.08)  # 10 removals at 100/s
+        self.assertIsNotNone(latency)
+
+
+class TestAuditLog(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.log_folder = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.log_folder, "dircleaner.log")
+        for i in range(5):
+            create_file(os.path.join(self.path, str(i)), days_old=40)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+        shutil.rmtree(self.log_folder)
+
+    def clean(self, summary):
+        logger, listener = dircleaner.init_logger(self.path, self.log_path,
+                                                  summary, capacity=2)
+        rm_time = dircleaner.calculate_days_ago_in_sec(time.time())
+        dircleaner.run_cleaner(self.path, rm_time, workers=2)
+        dircleaner.stop_logger(logger, listener)
+        with open(self.log_path) as f:
+            return f.read()
+
+    def test_log_every_file(self):
+        log = self.clean(summary=False)
+        self.assertEqual(5, log.count("File to removal found"))
+        self.assertIn("Removed 5 files (0 failed)", log)
+        self.assertEqual([], os.listdir(self.path))
+
+    def test_log_summary(self):
+        log = self.clean(summary=True)
+        self.assertNotIn("File to removal found", log)
+        self.assertIn("Removed 5 files (0 failed)", log)
+
+    def test_rotate_compressed(self):
+        handler = dircleaner.BatchFileHandler(self.log_path, capacity=10,
+                                              max_bytes=100, compress=True)
+        for i in range(50):
+            handler.handle(logging.makeLogRecord(
+                {"msg": "File to removal found: %i", "args": (i,),
+                 "levelno": logging.INFO}))
+        handler.close()
+        with gzip.open(self.log_path + ".1.gz", "rt") as f:
+            self.assertIn("File to removal found", f.read())
+        # each batch of 10 records is over max_bytes, so goes to its own file
+        self.assertEqual(sorted(["dircleaner.log"] + [
+            "dircleaner.log.%i.gz" % i for i in range(1, 5)]),
+            sorted(os.listdir(self.log_folder)))
+
+
+    def test_protect_log(self):
+        log_path = os.path.join(self.path, "dircleaner.log")
+        for name in ["dircleaner.log", "dircleaner.log.1.gz", "other.log"]:
+            create_file(os.path.join(self.path, name), days_old=50, size=10)
+        root = dircleaner.Root(self.path,
+                               rules=dircleaner.Rules(["*.keep"]))
+        dircleaner.protect_log(root, log_path)
+        self.assertTrue(root.rules.prunes("x.keep"))
+        outside = dircleaner.Root(self.log_folder)
+        dircleaner.protect_log(outside, log_path)
+        self.assertIsNone(outside.rules)
+
+        # quota of 0 removes every file with size, but the log
+        dircleaner.run_quota_cleaner(self.path, 0, workers=0,
+                                     rules=root.rules)
+        self.assertEqual(sorted(["0", "1", "2", "3", "4", "dircleaner.log",
+                                 "dircleaner.log.1.gz"]),
+                         sorted(os.listdir(self.path)))
+
+    def test_flush_interval(self):
+        logger, listener = dircleaner.init_logger(
+            self.path, self.log_path, capacity=1000, flush_interval=0.05)
+        try:
+            logger.info("File to removal found: x")
+            log = ""
+            for _ in range(100):  # listener flushes when queue is idle
+                time.sleep(0.02)
+                if os.path.exists(self.log_path):
+                    with open(self.log_path) as f:
+                        log = f.read()
+                if log:
+                    break
+        finally:
+            dircleaner.stop_logger(logger, listener)
+        self.assertIn("File to removal found: x", log)
+
+class TestMultiRoot(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.roots = []
+        for name in ["one", "two"]:
+            path = os.path.join(self.folder, name)
+            os.mkdir(path)
+            for i in range(20):
+                create_file(os.path.join(path, str(i)), days_old=i * 5,
+                            size=10)
+            self.roots.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_read_config(self):
+        config = os.path.join(self.folder, "roots.ini")
+        with open(config, "w") as f:
+            f.write("[DEFAULT]\nworkers = 2\n\n"
+                    "[one]\npath = %s\ndays = 10\n\n"
+                    "[two]\npath = %s\nquota = 1K\nworkers = 1\n" %
+                    tuple(self.roots))
+        one, two = dircleaner.read_config(config)
+        self.assertEqual((self.roots[0], 10, None, 2),
+                         (one.path, one.days, one.quota, one.workers))
+        self.assertEqual((self.roots[1], 30, 1024, 1),
+                         (two.path, two.days, two.quota, two.workers))
+
+    def test_run_roots(self):
+        roots = [dircleaner.Root(self.roots[0], days=52, workers=1),
+                 dircleaner.Root(self.roots[1], days=30, quota=0)]
+        one, two = dircleaner.run_roots(roots, workers=3, queue_size=2)
+        # files 11 .. 19 are older than 52 days
+        self.assertEqual(9, one.removed)
+        self.assertEqual(11, len(os.listdir(self.roots[0])))
+        # quota of 0 removes everything, the root is kept
+        self.assertEqual(20, two.removed)
+        self.assertEqual([], os.listdir(self.roots[1]))
+
+    def test_root_limiters(self):
+        roots = [dircleaner.Root(path, days=52) for path in self.roots]
+        one, two = dircleaner.run_roots(roots, max_stats=10000,
+                                        max_deletes=10000, backoff=True)
+        self.assertEqual((9, 9), (one.removed, two.removed))
+        # every root observes latency of its own share only
+        self.assertIsNot(one.limiters[1], two.limiters[1])
+        for lane in (one, two):
+            self.assertIsNotNone(lane.limiters[0].latency)
+            self.assertIsNotNone(lane.limiters[1].latency)
+        self.assertIsNone(dircleaner.delete_limiter.latency)
+
+    def test_lane_limit(self):
+        in_flight = {}
+        peak = {}
+        lock = threading.Lock()
+        remove_file = dircleaner.remove_file
+
+        def slow_remove(path):
+            root = os.path.dirname(path)
+            with lock:
+                in_flight[root] = in_flight.get(root, 0) + 1
+                peak[root] = max(peak.get(root, 0), in_flight[root])
+            time.sleep(0.005)
+            with lock:
+                in_flight[root] -= 1
+            return remove_file(path)
+
+        dircleaner.remove_file = slow_remove
+        try:
+            roots = [dircleaner.Root(self.roots[0], days=0, workers=1),
+                     dircleaner.Root(self.roots[1], days=0, workers=3)]
+            dircleaner.run_roots(roots, workers=4)
+        finally:
+            dircleaner.remove_file = remove_file
+        self.assertEqual(1, peak[self.roots[0]])
+        self.assertTrue(peak[self.roots[1]] <= 3)
+        self.assertEqual([], os.listdir(self.roots[0]))
 
 
 if __name__ == "__main__":
@@ -14,6 +14,12 @@ We are saving time on threads creation / destruction as these are expensive
 operations. Without thread pool we ought to create and kill
 around 100 threads per second under estimated load.
 
+Datagrams are received with recvfrom_into into a ring of preallocated
+buffers, workers get the buffer as memoryview and give it back to the ring
+after reply. So no string is allocated per incoming packet. When all buffers
+are in use the main thread waits for a free one, the rest of datagrams wait
+in the socket receive buffer.
+
 ###############################################################################
 
 The assignment
@@ -58,6 +64,43 @@ import re         # regular expressions to parse incoming message
 import sys
 
 
+class BufferRing(object):
+    """ Ring of preallocated receive buffers recycled after reply
+    """
+
+    def __init__(self, count=256, size=1024):
+        """ Allocate buffers
+
+        Arguments:
+            - count: int: amount of datagrams processed at once
+            - size: int: max size of datagram, longer ones are truncated
+        """
+        self.buffers = [bytearray(size) for _ in xrange(count)]
+        self.views = [memoryview(b) for b in self.buffers]
+        self.free = Queue.Queue()   # indexes of free buffers
+        for index in xrange(count):
+            self.free.put(index)
+
+    def receive(self, sock):
+        """ Receive datagram into free buffer, wait for one if none is free
+
+        Arguments:
+            - sock: socket: UDP socket to receive from
+
+        Returns:
+            - (addr, index, view): sender, buffer index to be released and
+              memoryview of received data
+        """
+        index = self.free.get()
+        nbytes, addr = sock.recvfrom_into(self.buffers[index])
+        return addr, index, self.views[index][:nbytes]
+
+    def release(self, index):
+        """ Give buffer back to the ring after reply was sent
+        """
+        self.free.put(index)
+
+
 class ClientThread(threading.Thread):
     """ Thread class to process worker thread
     """
@@ -67,6 +110,8 @@ class ClientThread(threading.Thread):
 
             Thread will run forever, picking the work items from the pool,
             processing them, sending responses, picking another, processing ...
+            Work item is (addr, index, view) from BufferRing.receive,
+            the buffer is released after response is sent.
 
             Input:
             id=[id];name=[name]
@@ -92,19 +137,21 @@ class ClientThread(threading.Thread):
                 if request is None:
                     continue  # skip cycle and get next request
 
-                # Read received data
-                print '%s says %s' % (request[0], request[1])
+                # Read received data, only its length is logged:
+                # printing the content would copy every datagram
+                print '%s sent %i bytes' % (request[0], len(request[2]))
 
                 p = re.compile("id=\[([\d]*)\];name=\[(.*)\]")
                 # for 10 characters limitation
                 # p2 = re.compile("id=\[([\d]*)\];name=\[([\w]{1|10}})\]")
 
-                m = p.match(request[1])
+                # match in place, up to the end of received data
+                m = p.match(ring.buffers[request[1]], 0, len(request[2]))
                 if m is None:
                     raise ValueError("Format of incoming message was invalid")
 
-                r_id = int(m.group(1))
-                name = m.group(2)
+                r_id = int(str(m.group(1)))
+                name = str(m.group(2))  # copy, buffer is reused
 
                 # check if id is in ids_dict
                 if r_id in ids_dict:  # if present - increment occurrences
@@ -135,6 +182,10 @@ class ClientThread(threading.Thread):
                 socket.sendto("Error occurred on message processing",
                               request[0])
 
+            finally:
+                if request is not None:
+                    ring.release(request[1])  # buffer could be reused
+
 
 # Parse command line arguments (python 2.7)
 # parser = argparse.ArgumentParser(description="udp_requests_processor")
@@ -153,7 +204,9 @@ UDP_PORT = int(sys.argv[1])     # args.port[0]  # get port from cmd line
 
 # Create task queue
 requests_pool = Queue.Queue()   # queue for incoming messages
+ring = BufferRing(256, 1024)    # receive buffers, in flight at once
 ids_dict = {}                   # storage for ids
+DIE_MESSAGE = "Dear server please die"
 
 # Start several threads, amount of them depends on configuration
 # for our case we need to process 100 requests per second,
@@ -173,15 +226,15 @@ socket.bind((UDP_IP, UDP_PORT))              # bind to socket
 print "Server initialized at %s:%i" % (UDP_IP, UDP_PORT)
 
 while True:  # run server thread until interrupted by special signal
-    data, addr = socket.recvfrom(1024)
+    addr, index, view = ring.receive(socket)
 
-    if data == "Dear server please die":
+    if len(view) == len(DIE_MESSAGE) and view.tobytes() == DIE_MESSAGE:
         # TODO: remove this if remove shutdown should be avoided
         print "Die message received. Killing threads..."
         # threads are daemons, will be killed automatically on program end
         break
 
     # put request data to pool to be processed by threads
-    requests_pool.put((addr, data))
+    requests_pool.put((addr, index, view))
 
 socket.close()  # this code is called in GC anyway...